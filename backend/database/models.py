@@ -1,12 +1,49 @@
-from sqlalchemy import Column, Integer, String, create_engine, Float, DateTime, ForeignKey, JSON, Numeric
+from sqlalchemy import Column, Integer, String, create_engine, event, Float, DateTime, ForeignKey, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to SQLAlchemy's stdlib json
+    orjson = None
+
+def _orjson_dumps(value):
+    # The JSON columns are TEXT in SQLite, so hand back str rather than bytes
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+_json_options = {"json_serializer": _orjson_dumps, "json_deserializer": orjson.loads} if orjson else {}
+
 SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+    future=True,
+    query_cache_size=1200,
+    **_json_options,
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL + NORMAL sync avoids a full fsync per commit; mmap and a larger
+    # page cache keep reads off the read() syscall path
+    cursor = dbapi_connection.cursor()
+    cursor.executescript(
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA mmap_size=268435456;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA cache_size=-65536;"
+    )
+    cursor.close()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 Base = declarative_base()
 
 class User(Base):
@@ -20,6 +57,10 @@ class User(Base):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        # Ownership checks filter on user_id alone or user_id plus id
+        Index("ix_projects_user_id_id", "user_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -31,12 +72,15 @@ class Project(Base):
     # Store estimation attributes as JSON
     attributes = Column(JSON)
     estimates = Column(JSON)
+    # Summary of ``estimates`` kept in sync on write for the project list
+    estimated_cost = Column(Float, nullable=True)
+    estimation_methods_count = Column(Integer, default=0)
     
     # Budget and financial metrics
-    initial_budget = Column(Numeric(10, 2), nullable=True)
-    actual_cost = Column(Numeric(10, 2), nullable=True)
-    expected_revenue = Column(Numeric(10, 2), nullable=True)
-    discount_rate = Column(Numeric(5, 2), nullable=True)  # For NPV calculations
+    initial_budget = Column(Float, nullable=True)
+    actual_cost = Column(Float, nullable=True)
+    expected_revenue = Column(Float, nullable=True)
+    discount_rate = Column(Float, nullable=True)  # For NPV calculations
     cash_flows = Column(JSON)  # Store periodic cash flows for financial calculations
     budget_tracking = Column(JSON)  # Store budget tracking data
     financial_metrics = Column(JSON)  # Store calculated financial metrics
@@ -46,11 +90,26 @@ class Project(Base):
     
     # Resource allocation data
     resource_allocation = Column(JSON)  # Store resource allocation and optimization results
+    resource_allocation_digests = Column(JSON)  # Input digest per stored result, kept from clients
     resources = Column(JSON)  # Store project resources
     tasks = Column(JSON)  # Store project tasks
     
     # Relationship to user
     user = relationship("User", back_populates="projects")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+def add_missing_columns():
+    """Add model columns that an existing database's tables lack.
+
+    ``create_all`` only creates missing tables, so columns introduced since
+    a table was created are added here. New columns are nullable and
+    existing rows read them as NULL.
+    """
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                    )
@@ -10,6 +10,8 @@ from routers.project import router as project_router
 from routers.risk_management import router as risk_management_router
 from routers.budgeting import router as budgeting_router
 from routers.resource_allocation import router as resource_allocation_router
+from routers import _finance_kernels, _estimation_kernels, _resource_kernels, _risk_kernels
+from routers.cost_estimation import warmup_cocomo
 from database import models
 from database.models import SessionLocal
 import schemas, security
@@ -37,6 +39,27 @@ app.include_router(risk_management_router, prefix="/risk", tags=["Risk Managemen
 app.include_router(budgeting_router, prefix="/budget", tags=["Budget Management"])
 app.include_router(resource_allocation_router, prefix="/resource", tags=["Resource Allocation"])
 
+@app.on_event("startup")
+def create_tables():
+    # Create missing tables once per process instead of at models import,
+    # then bring older databases' tables up to the current columns
+    models.Base.metadata.create_all(bind=models.engine)
+    models.add_missing_columns()
+
+@app.on_event("startup")
+def warmup_kernels():
+    # Compile the numeric kernels before serving the first request
+    _finance_kernels.warmup()
+    _estimation_kernels.warmup()
+    _resource_kernels.warmup()
+    _risk_kernels.warmup()
+    warmup_cocomo()
+
+@app.on_event("shutdown")
+def dispose_engine():
+    # Close pooled database connections
+    models.engine.dispose()
+
 @app.get("/")
 def read_root():
     return {
@@ -0,0 +1,69 @@
+"""Numeric kernels for the cost estimation statistics.
+
+Like ``routers._finance_kernels`` these are compiled with Numba when it is
+installed and run as plain Python otherwise. They take float64 arrays.
+"""
+import numpy as np
+
+from routers._finance_kernels import njit
+
+
+@njit(cache=True, nogil=True)
+def welford_nb(values):
+    """Mean, sample variance, min and max in a single pass.
+
+    The mean and variance use Welford's online algorithm; min/max are
+    branch-free ``min``/``max`` updates.
+    """
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    lo = np.inf
+    hi = -np.inf
+    for x in values:
+        n += 1
+        delta = x - mean
+        mean += delta / n
+        m2 += delta * (x - mean)
+        lo = min(lo, x)
+        hi = max(hi, x)
+    variance = m2 / (n - 1) if n > 1 else 0.0
+    return mean, variance, lo, hi
+
+
+@njit(cache=True, nogil=True)
+def linreg_nb(x, y):
+    """Least-squares slope, intercept and R-squared of ``y`` against ``x``.
+
+    Raises ZeroDivisionError when all ``x`` are equal.
+    """
+    n = x.size
+    sum_x = 0.0
+    sum_y = 0.0
+    sum_xy = 0.0
+    sum_x2 = 0.0
+    for i in range(n):
+        sum_x += x[i]
+        sum_y += y[i]
+        sum_xy += x[i] * y[i]
+        sum_x2 += x[i] * x[i]
+
+    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
+    intercept = (sum_y - slope * sum_x) / n
+
+    y_mean = sum_y / n
+    ss_tot = 0.0
+    ss_res = 0.0
+    for i in range(n):
+        ss_tot += (y[i] - y_mean) ** 2
+        resid = y[i] - (intercept + slope * x[i])
+        ss_res += resid * resid
+    r_squared = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0.0
+    return slope, intercept, r_squared
+
+
+def warmup():
+    """Trigger JIT compilation so the first request does not pay for it"""
+    values = np.array([1.0, 2.0])
+    welford_nb(values)
+    linreg_nb(values, values)
@@ -0,0 +1,120 @@
+"""Numeric kernels for the budgeting financial metrics.
+
+The kernels are compiled with Numba when it is installed and run as plain
+Python otherwise. They take float64 arrays and return NaN where the public
+helpers in ``routers.budgeting`` return ``None``.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, run the kernels uncompiled
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def npv_nb(rate, cfs):
+    """Net present value of ``cfs`` discounted at ``rate`` (decimal)"""
+    s = 0.0
+    d = 1.0
+    for v in cfs:
+        s += v / d
+        d *= 1.0 + rate
+    return s
+
+
+@njit(cache=True, nogil=True)
+def irr_nb(cfs, guess=0.1, tol=1e-6, maxiter=100):
+    """Internal rate of return (decimal) using Newton-Raphson.
+
+    Falls back to bisection when Newton stalls or leaves the (-1, inf)
+    domain, and returns NaN if no sign change can be bracketed.
+    """
+    rate = guess
+    for _ in range(maxiter):
+        npv = 0.0
+        dnpv = 0.0
+        # v = (1 + rate) ** -i as a running product, one division per step
+        inv = 1.0 / (1.0 + rate)
+        v = 1.0
+        for i in range(cfs.size):
+            npv += cfs[i] * v
+            dnpv -= i * cfs[i] * v * inv
+            v *= inv
+
+        if abs(dnpv) < tol:
+            break
+
+        new_rate = rate - npv / dnpv
+        if new_rate <= -1.0:
+            break
+        if abs(new_rate - rate) < tol:
+            return new_rate
+        rate = new_rate
+    return _irr_bisect(cfs, tol)
+
+
+@njit(cache=True, nogil=True)
+def _irr_bisect(cfs, tol):
+    lo = -0.99
+    hi = 1.0
+    f_lo = npv_nb(lo, cfs)
+    f_hi = npv_nb(hi, cfs)
+    while f_lo * f_hi > 0.0:
+        if hi > 1e6:
+            return np.nan
+        hi *= 2.0
+        f_hi = npv_nb(hi, cfs)
+
+    for _ in range(200):
+        mid = 0.5 * (lo + hi)
+        f_mid = npv_nb(mid, cfs)
+        if f_mid == 0.0 or hi - lo < tol:
+            return mid
+        if f_lo * f_mid < 0.0:
+            hi = mid
+        else:
+            lo = mid
+            f_lo = f_mid
+    return 0.5 * (lo + hi)
+
+
+def compute_all_metrics(initial_investment, cfs, rate):
+    """NPV, IRR (decimal) and payback period for ``cfs`` (investment first).
+
+    The cash flows are converted once and the discount factors are built
+    with a running product instead of a power per period. Missing metrics
+    are returned as NaN.
+    """
+    cfs = np.asarray(cfs, dtype=np.float64)
+    n = cfs.size
+
+    # discount[i] = (1 + rate) ** i, accumulated in place in one buffer
+    discount = np.empty(n)
+    discount[0] = 1.0
+    discount[1:] = 1.0 + rate
+    np.multiply.accumulate(discount[1:], out=discount[1:])
+    npv = (cfs / discount).sum()
+
+    irr = irr_nb(cfs) if n >= 2 else np.nan
+
+    payback = np.nan
+    returns = cfs[1:]
+    cumulative = returns.cumsum()
+    reached = cumulative >= initial_investment
+    if reached.any():
+        i = int(reached.argmax())
+        payback = i + (initial_investment - (cumulative[i] - returns[i])) / returns[i]
+
+    return float(npv), float(irr), float(payback)
+
+
+def warmup():
+    """Trigger JIT compilation so the first request does not pay for it"""
+    cfs = np.array([-100.0, 60.0, 60.0])
+    npv_nb(0.1, cfs)
+    irr_nb(cfs)
+    compute_all_metrics(100.0, cfs, 0.1)
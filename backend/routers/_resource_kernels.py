@@ -0,0 +1,99 @@
+"""Numeric kernels for the resource leveling and smoothing schedulers.
+
+Like ``routers._finance_kernels`` these are compiled with Numba when it is
+installed and run as plain Python otherwise. ``usage`` is a float64 matrix
+of resources by whole hours from the project start.
+"""
+import numpy as np
+
+from routers._finance_kernels import njit
+
+
+@njit(cache=True, nogil=True)
+def find_best_slot_nb(usage, rows, quantities, capacities, base, candidates, hours):
+    """Offset from ``base`` of the start with the lowest peak that fits capacity.
+
+    Ties go to the earliest start; 0 is returned when no start fits. Each
+    resource row is scanned once for all candidate starts, keeping a running
+    count of over-capacity hours and a monotonic deque for the window peak.
+    The scan stops as soon as every start has a conflict.
+    """
+    if candidates <= 0 or hours <= 0:
+        return 0
+    span = candidates + hours - 1
+    conflict = np.zeros(candidates, dtype=np.bool_)
+    peak = np.zeros(candidates)
+    window = np.empty(span, dtype=np.intp)
+    feasible = candidates
+    for k in range(rows.size):
+        row = usage[rows[k], base:base + span] + quantities[k]
+        capacity = capacities[rows[k]]
+        over = 0
+        head = 0
+        tail = 0
+        for i in range(span):
+            value = row[i]
+            if value > capacity:
+                over += 1
+            while tail > head and row[window[tail - 1]] <= value:
+                tail -= 1
+            window[tail] = i
+            tail += 1
+            start = i - hours + 1
+            if start < 0:
+                continue
+            if window[head] < start:
+                head += 1
+            if over > 0 and not conflict[start]:
+                conflict[start] = True
+                feasible -= 1
+            if not conflict[start]:
+                peak[start] = max(peak[start], row[window[head]])
+            if row[start] > capacity:
+                over -= 1
+        if feasible == 0:
+            return 0
+
+    best_offset = 0
+    best_peak = np.inf
+    for offset in range(candidates):
+        if not conflict[offset] and peak[offset] < best_peak:
+            best_peak = peak[offset]
+            best_offset = offset
+    return best_offset
+
+
+@njit(cache=True, nogil=True)
+def find_least_contention_slot_nb(usage, rows, quantities, targets, base, candidates, hours):
+    """Offset from ``base`` of the start with the least usage above ``targets``.
+
+    Ties go to the earliest start; 0 is returned when there are no candidates.
+    Contention only grows while a start is scored, so scoring stops once it
+    reaches the best so far, and the search stops at a contention-free start.
+    """
+    best_offset = 0
+    min_contention = np.inf
+    for offset in range(candidates):
+        total_contention = 0.0
+        for k in range(rows.size):
+            r = rows[k]
+            for h in range(hours):
+                new_usage = usage[r, base + offset + h] + quantities[k]
+                if new_usage > targets[r]:
+                    total_contention += new_usage - targets[r]
+            if total_contention >= min_contention:
+                break
+        if total_contention < min_contention:
+            min_contention = total_contention
+            best_offset = offset
+            if min_contention == 0.0:
+                break
+    return best_offset
+
+
+def warmup():
+    """Trigger JIT compilation so the first request does not pay for it"""
+    usage = np.zeros((1, 2))
+    rows = np.zeros(1, dtype=np.intp)
+    find_best_slot_nb(usage, rows, np.ones(1), np.ones(1), 0, 1, 1)
+    find_least_contention_slot_nb(usage, rows, np.ones(1), np.ones(1), 0, 1, 1)
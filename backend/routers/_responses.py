@@ -0,0 +1,31 @@
+"""JSON encoding for the endpoints that return large nested payloads."""
+from fastapi.responses import Response
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, let FastAPI encode as usual
+    orjson = None
+
+
+def fast_json(content):
+    """Encode ``content`` with orjson, bypassing FastAPI's jsonable_encoder walk.
+
+    Without orjson the content is returned unchanged for the default encoder.
+    """
+    if orjson is None:
+        return content
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+    )
+
+
+def compact_floats(values):
+    """``values`` as float32, precise enough for charts and half the digits.
+
+    orjson encodes the array as is, in float32's shortest form; without it a
+    plain list is returned for the stdlib encoder.
+    """
+    values = np.asarray(values, dtype=np.float32, order="C")
+    return values if orjson is not None else values.tolist()
@@ -0,0 +1,43 @@
+"""Numeric kernels for the Monte Carlo risk simulation.
+
+Like ``routers._finance_kernels`` these are compiled with Numba when it is
+installed and run as plain Python otherwise. They take float64 arrays.
+"""
+import math
+
+import numpy as np
+
+from routers._finance_kernels import njit
+
+SQRT1_2 = 1.0 / math.sqrt(2.0)
+
+
+@njit(cache=True, nogil=True)
+def normals_to_ranges_nb(z, mins, ranges, means, stds):
+    """Map standard normals onto each variable's ``[min, max]``, in place.
+
+    ``z`` has one row per variable. Each draw goes through the normal CDF,
+    written with ``erf``, and is rescaled in the same pass, so no
+    intermediate array is allocated. The per-variable mean and population
+    standard deviation are accumulated along the way (Welford) into
+    ``means`` and ``stds``, while each draw is still in cache. Returns ``z``.
+    """
+    for j in range(z.shape[0]):
+        lo = mins[j]
+        span = ranges[j]
+        mean = 0.0
+        m2 = 0.0
+        for i in range(z.shape[1]):
+            x = lo + 0.5 * (1.0 + math.erf(z[j, i] * SQRT1_2)) * span
+            z[j, i] = x
+            delta = x - mean
+            mean += delta / (i + 1)
+            m2 += delta * (x - mean)
+        means[j] = mean
+        stds[j] = math.sqrt(m2 / z.shape[1]) if z.shape[1] else math.nan
+    return z
+
+
+def warmup():
+    """Trigger JIT compilation so the first request does not pay for it"""
+    normals_to_ranges_nb(np.zeros((1, 1)), np.zeros(1), np.ones(1), np.empty(1), np.empty(1))
@@ -1,8 +1,13 @@
 from typing import List, Dict, Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only, raiseload
+from sqlalchemy.orm.attributes import flag_modified
 from datetime import datetime
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
 from pydantic import BaseModel, Field
+import json
 import numpy as np
 from numpy.typing import ArrayLike
 
@@ -10,6 +15,7 @@ from database import models
 from db import get_db
 import schemas
 from security import oauth2_scheme, get_current_user
+from routers._finance_kernels import compute_all_metrics
 
 router = APIRouter()
 
@@ -40,83 +46,124 @@ def calculate_roi(initial_investment: float, total_returns: float) -> float:
     """Calculate Return on Investment (ROI)"""
     return ((total_returns - initial_investment) / initial_investment) * 100
 
-def calculate_npv(cash_flows: List[float], discount_rate: float) -> float:
-    """Calculate Net Present Value (NPV)"""
-    rate = discount_rate / 100  # Convert percentage to decimal
-    npv = sum(cf / (1 + rate) ** i for i, cf in enumerate(cash_flows))
-    return round(npv, 2)
+def _get_owned_project(db: Session, project_id: int, user_id: int, *columns) -> models.Project:
+    """Fetch a project by primary key, raising 404 unless it belongs to the user.
 
-def calculate_irr(cash_flows: List[float], max_iterations: int = 100, tolerance: float = 1e-6) -> Optional[float]:
-    """Calculate Internal Rate of Return (IRR) using Newton-Raphson method"""
-    if not cash_flows or len(cash_flows) < 2:
-        return None
+    Only ``columns`` (plus the id and owner) are loaded, so the other JSON
+    blobs on the row are never deserialized; relationships raise if touched.
+    """
+    project = db.get(
+        models.Project,
+        project_id,
+        options=[load_only(models.Project.id, models.Project.user_id, *columns), raiseload("*")],
+    )
+    if project is None or project.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+def _category_analysis(tracked_periods: Dict, periods: List[str]):
+    """Per-category totals, per-period amounts and share of the total actual cost"""
+    period_categories = [tracked_periods[p]["categories"] for p in periods]
+    category_names = list(dict.fromkeys(c for cats in period_categories for c in cats))
+    
+    # periods x categories, NaN where a category has no cost in a period
+    amounts = np.array(
+        [[cats.get(c, np.nan) for c in category_names] for cats in period_categories],
+        dtype=np.float64,
+    ).reshape(len(periods), len(category_names))
+    totals = np.nansum(amounts, axis=0)
+    total_actual = sum(tracked_periods[p]["actual"] for p in periods)
     
-    # Initial guess
-    rate = 0.1
+    categories = {}
+    for j, category in enumerate(category_names):
+        categories[category] = {
+            "total": float(totals[j]),
+            "periods": {p: cats[category] for p, cats in zip(periods, period_categories) if category in cats},
+            "percentage": round(float(totals[j] / total_actual) * 100, 2),
+        }
+    return categories, total_actual
+
+def _analyze_tracking(tracked_periods: Dict):
+    """Sorted periods, 3-period forecast and category analysis of tracked periods"""
+    # Get all periods and sort them
+    periods = sorted(tracked_periods.keys())
     
-    for _ in range(max_iterations):
-        # Calculate NPV and its derivative
-        npv = sum(cf / (1 + rate) ** i for i, cf in enumerate(cash_flows))
-        dnpv = sum(-i * cf / (1 + rate) ** (i + 1) for i, cf in enumerate(cash_flows))
+    # Calculate trend for forecasting
+    if len(periods) >= 2:
+        costs = np.array([tracked_periods[p]["actual"] for p in periods], dtype=np.float64)
+        n = costs.size
         
-        if abs(dnpv) < tolerance:
-            break
-            
-        # Newton-Raphson iteration
-        new_rate = rate - npv / dnpv
+        # Closed-form least-squares line through (period index, cost)
+        dx = np.arange(n) - (n - 1) / 2
+        y_mean = costs.mean()
+        slope = (dx * (costs - y_mean)).sum() / (dx * dx).sum()
+        intercept = y_mean - slope * (n - 1) / 2
         
-        if abs(new_rate - rate) < tolerance:
-            return round(new_rate * 100, 2)  # Convert to percentage
-            
-        rate = new_rate
+        # Forecast next 3 periods
+        next_periods = n + np.arange(3)
+        forecast = [round(f, 2) for f in intercept + slope * next_periods]
+    else:
+        forecast = None
     
-    return None
+    # Calculate category-wise analysis
+    categories, total_actual = _category_analysis(tracked_periods, periods)
+    return periods, forecast, categories, total_actual
 
-def calculate_payback_period(initial_investment: float, cash_flows: List[float]) -> Optional[float]:
-    """Calculate Payback Period"""
-    if not cash_flows or initial_investment <= 0:
-        return None
-        
-    cumulative = 0
-    for i, cf in enumerate(cash_flows[1:], 1):  # Skip initial investment
-        cumulative += cf
-        if cumulative >= initial_investment:
-            # Linear interpolation for more accurate payback period
-            prev_cumulative = cumulative - cf
-            fraction = (initial_investment - prev_cumulative) / cf
-            return round(i - 1 + fraction, 2)
-    return None
+# Tracking analyses as JSON keyed by project and a digest of the row version,
+# least recently used first
+TRACKING_CACHE_SIZE = 1024
+_tracking_cache = OrderedDict()
+_tracking_cache_lock = Lock()
+
+def cached_tracking_analysis(project: models.Project):
+    """``_analyze_tracking`` of the project's periods, reusing earlier runs.
+
+    Every write to the row bumps ``updated_at``, so the key changes with
+    the tracking data and repeated GETs of an unchanged project skip both
+    the analysis and any serialization of the history. The cache holds
+    JSON, so every caller gets its own copy.
+    """
+    periods = project.budget_tracking["periods"]
+    version = project.updated_at.isoformat() if project.updated_at else json.dumps(periods, sort_keys=True)
+    key = (project.id, blake2b(version.encode(), digest_size=16).digest())
+    with _tracking_cache_lock:
+        cached = _tracking_cache.get(key)
+        if cached is not None:
+            _tracking_cache.move_to_end(key)
+    
+    if cached is None:
+        cached = json.dumps(_analyze_tracking(periods))
+        with _tracking_cache_lock:
+            _tracking_cache[key] = cached
+            if len(_tracking_cache) > TRACKING_CACHE_SIZE:
+                _tracking_cache.popitem(last=False)
+    
+    return json.loads(cached)
 
 @router.post("/{project_id}/financials")
-async def calculate_financial_metrics(
+def calculate_financial_metrics(
     project_id: int,
     input_data: FinancialInput,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Calculate financial metrics for a project"""
-    project = db.query(models.Project).filter(
-        models.Project.id == project_id,
-        models.Project.user_id == current_user.id
-    ).first()
-    
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = _get_owned_project(db, project_id, current_user.id, models.Project.financial_metrics)
     
     # Prepare cash flows array (initial investment as negative)
     cash_flows = [-input_data.initial_investment] + input_data.cash_flows
     
     # Calculate metrics
     roi = calculate_roi(input_data.initial_investment, sum(input_data.cash_flows))
-    npv = calculate_npv(cash_flows, input_data.discount_rate)
-    irr = calculate_irr(cash_flows)
-    payback = calculate_payback_period(input_data.initial_investment, input_data.cash_flows)
+    npv, irr, payback = compute_all_metrics(
+        input_data.initial_investment, cash_flows, input_data.discount_rate / 100
+    )
     
     metrics = {
         "roi": round(roi, 2),
-        "npv": npv,
-        "irr": irr,
-        "payback_period": round(payback, 2) if payback else None,
+        "npv": round(npv, 2),
+        "irr": None if np.isnan(irr) else round(irr * 100, 2),
+        "payback_period": round(payback, 2) if payback and not np.isnan(payback) else None,
         "details": {
             "total_investment": input_data.initial_investment,
             "total_returns": sum(input_data.cash_flows),
@@ -131,20 +178,19 @@ async def calculate_financial_metrics(
     return metrics
 
 @router.post("/{project_id}/track")
-async def track_budget(
+def track_budget(
     project_id: int,
     update: BudgetUpdate,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Track actual costs against budget"""
-    project = db.query(models.Project).filter(
-        models.Project.id == project_id,
-        models.Project.user_id == current_user.id
-    ).first()
-    
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = _get_owned_project(
+        db, project_id, current_user.id,
+        models.Project.initial_budget,
+        models.Project.actual_cost,
+        models.Project.budget_tracking,
+    )
     
     # Initialize budget tracking if not exists
     if not project.budget_tracking:
@@ -164,20 +210,22 @@ async def track_budget(
         period_data["categories"][update.category] = 0
     
     period_data["categories"][update.category] += update.actual_cost
-    period_data["actual"] += update.actual_cost    # Update total actual cost
-    from decimal import Decimal
-    current_actual = Decimal(str(project.actual_cost or 0))
-    project.actual_cost = current_actual + Decimal(str(update.actual_cost))
+    period_data["actual"] += update.actual_cost
+    
+    # Update total actual cost, kept to cents
+    project.actual_cost = round((project.actual_cost or 0) + update.actual_cost, 2)
     
     # Calculate variance
     if project.initial_budget:
-        variance = float(project.initial_budget) - float(project.actual_cost)
-        variance_percentage = (variance / float(project.initial_budget)) * 100
+        variance = project.initial_budget - project.actual_cost
+        variance_percentage = (variance / project.initial_budget) * 100
         project.budget_tracking["variance"] = {
             "amount": round(variance, 2),
             "percentage": round(variance_percentage, 2)
         }
     
+    # The JSON column was mutated in place, which SQLAlchemy cannot detect
+    flag_modified(project, "budget_tracking")
     db.commit()
     
     return {
@@ -188,58 +236,24 @@ async def track_budget(
     }
 
 @router.get("/{project_id}/analysis")
-async def get_budget_analysis(
+def get_budget_analysis(
     project_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Get budget analysis including variance and forecasting"""
-    project = db.query(models.Project).filter(
-        models.Project.id == project_id,
-        models.Project.user_id == current_user.id
-    ).first()
-    
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = _get_owned_project(
+        db, project_id, current_user.id,
+        models.Project.initial_budget,
+        models.Project.budget_tracking,
+        models.Project.financial_metrics,
+        models.Project.updated_at,
+    )
     
     if not project.budget_tracking:
         raise HTTPException(status_code=400, detail="No budget tracking data available")
     
-    # Get all periods and sort them
-    periods = sorted(project.budget_tracking["periods"].keys())
-    
-    # Calculate trend for forecasting
-    if len(periods) >= 2:
-        costs = [project.budget_tracking["periods"][p]["actual"] for p in periods]
-        x = np.arange(len(costs))
-        z = np.polyfit(x, costs, 1)
-        trend = np.poly1d(z)
-        
-        # Forecast next 3 periods
-        next_periods = len(costs) + np.arange(3)
-        forecast = trend(next_periods)
-    else:
-        forecast = None
-    
-    # Calculate category-wise analysis
-    categories = {}
-    total_actual = 0
-    
-    for period in periods:
-        period_data = project.budget_tracking["periods"][period]
-        total_actual += period_data["actual"]
-        
-        for category, amount in period_data["categories"].items():
-            if category not in categories:
-                categories[category] = {"total": 0, "periods": {}}
-            categories[category]["total"] += amount
-            categories[category]["periods"][period] = amount
-    
-    # Calculate category percentages
-    for category in categories:
-        categories[category]["percentage"] = round(
-            (categories[category]["total"] / total_actual) * 100, 2
-        )
+    periods, forecast, categories, total_actual = cached_tracking_analysis(project)
     
     return {
         "total_budget": project.initial_budget,
@@ -247,6 +261,6 @@ async def get_budget_analysis(
         "variance": project.budget_tracking.get("variance"),
         "category_analysis": categories,
         "periods": periods,
-        "forecast": [round(f, 2) for f in forecast] if forecast is not None else None,
+        "forecast": forecast,
         "financial_metrics": project.financial_metrics
     }
@@ -1,18 +1,31 @@
-from typing import List, Dict, Optional
+from typing import Annotated, List, Dict, Optional
+from functools import lru_cache
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+import numpy as np
 import statistics
 import math
 
 from database import models
 from db import get_db
 import schemas
+from schemas import MAX_EXPERT_ESTIMATES
 from security import oauth2_scheme, get_current_user
+from routers._finance_kernels import njit
+from routers._estimation_kernels import welford_nb, linreg_nb
+from routers._responses import fast_json
 
 router = APIRouter()
 
+# Bounds on expert panels (shared with schemas) and Delphi rounds keep the
+# worst-case work per request fixed
+MAX_DELPHI_ROUNDS = 10
+# Projects per batch request, for the same reason
+MAX_BATCH_PROJECTS = 1000
+FiniteFloat = Annotated[float, Field(allow_inf_nan=False)]
+
 class COCOMOInput(BaseModel):
     size_kloc: float = Field(..., gt=0, description="Size in Kilo Lines of Code")
     mode: str = Field(..., pattern="^(organic|semi-detached|embedded)$", description="Project complexity mode")
@@ -22,15 +35,21 @@ class FunctionPointInput(BaseModel):
     caf: float = Field(..., ge=0.65, le=1.35, description="Complexity Adjustment Factor")
 
 class ExpertJudgmentInput(BaseModel):
-    expert_estimates: List[float] = Field(..., min_length=1, description="List of expert estimates")
+    expert_estimates: List[FiniteFloat] = Field(..., min_length=1, max_length=MAX_EXPERT_ESTIMATES, description="List of expert estimates")
 
 class DelphiInput(BaseModel):
-    expert_estimates: List[float] = Field(..., min_length=3, description="List of expert estimates for Delphi method")
-    rounds: int = Field(default=1, description="Number of Delphi rounds")
+    expert_estimates: List[FiniteFloat] = Field(..., min_length=3, max_length=MAX_EXPERT_ESTIMATES, description="List of expert estimates for Delphi method")
+    rounds: int = Field(default=1, ge=1, le=MAX_DELPHI_ROUNDS, description="Number of Delphi rounds")
+
+class HistoricalPoint(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    size: float = 0
+    effort: float = 0
 
 class RegressionInput(BaseModel):
     size: float = Field(..., gt=0, description="Project size metric")
-    historical_data: Optional[List[Dict[str, float]]] = Field(default=None, description="Historical project data")
+    historical_data: Optional[List[HistoricalPoint]] = Field(default=None, description="Historical project data")
 
 class ComprehensiveEstimationInput(BaseModel):
     project_name: str = Field(..., description="Project name")
@@ -41,10 +60,20 @@ class ComprehensiveEstimationInput(BaseModel):
     ufp: Optional[int] = Field(None, gt=0)
     caf: Optional[float] = Field(None, ge=0.65, le=1.35)
     # Expert estimates
-    expert_estimates: Optional[List[float]] = Field(None, min_length=1)
+    expert_estimates: Optional[List[FiniteFloat]] = Field(None, min_length=1, max_length=MAX_EXPERT_ESTIMATES)
     # Regression parameters
     regression_size: Optional[float] = Field(None, gt=0)
 
+class BatchEstimationInput(BaseModel):
+    # COCOMO parameters, one entry per project
+    size_kloc: Optional[List[Annotated[float, Field(gt=0)]]] = Field(None, min_length=1, max_length=MAX_BATCH_PROJECTS)
+    mode: Optional[List[Annotated[str, Field(pattern="^(organic|semi-detached|embedded)$")]]] = Field(None, min_length=1, max_length=MAX_BATCH_PROJECTS)
+    # Function Points parameters
+    ufp: Optional[List[Annotated[int, Field(gt=0)]]] = Field(None, min_length=1, max_length=MAX_BATCH_PROJECTS)
+    caf: Optional[List[Annotated[float, Field(ge=0.65, le=1.35)]]] = Field(None, min_length=1, max_length=MAX_BATCH_PROJECTS)
+    # Regression parameters
+    regression_size: Optional[List[Annotated[float, Field(gt=0)]]] = Field(None, min_length=1, max_length=MAX_BATCH_PROJECTS)
+
 class EstimationResult(BaseModel):
     method: str
     estimate: float
@@ -53,59 +82,92 @@ class EstimationResult(BaseModel):
 
 # --- Enhanced Estimation Functions ---
 
-def cocomo_basic(size_kloc: float, mode: str) -> Dict:
-    """Enhanced COCOMO Basic model with detailed calculations"""
-    modes = {
-        "organic": {"a": 2.4, "b": 1.05, "description": "Small, experienced teams"},
-        "semi-detached": {"a": 3.0, "b": 1.12, "description": "Medium size, mixed experience"},
-        "embedded": {"a": 3.6, "b": 1.20, "description": "Large, complex systems"}
-    }
-    
-    if mode not in modes:
-        raise ValueError(f"Invalid mode: {mode}")
-    
-    coefficients = modes[mode]
-    effort = coefficients["a"] * (size_kloc ** coefficients["b"])
+COCOMO_MODES = {
+    "organic": {"a": 2.4, "b": 1.05, "description": "Small, experienced teams"},
+    "semi-detached": {"a": 3.0, "b": 1.12, "description": "Medium size, mixed experience"},
+    "embedded": {"a": 3.6, "b": 1.20, "description": "Large, complex systems"}
+}
+
+# Development time: TDEV = 2.5 * effort ** 0.38
+COCOMO_TDEV_A = 2.5
+COCOMO_TDEV_B = 0.38
+
+def _cocomo_effort_kernel(a: float, b: float):
+    """Effort function with the mode coefficients folded in as constants"""
+    @njit
+    def effort(size_kloc):
+        return a * size_kloc ** b
+    return effort
+
+# One specialized kernel per mode; each accepts a scalar or a float64 array
+COCOMO_EFFORT = {mode: _cocomo_effort_kernel(c["a"], c["b"]) for mode, c in COCOMO_MODES.items()}
+
+def warmup_cocomo():
+    """Compile the COCOMO kernels for scalar and array input"""
+    for effort in COCOMO_EFFORT.values():
+        effort(1.0)
+        effort(np.ones(1))
+
+@lru_cache(maxsize=4096)
+def _cocomo_cached(size_kloc: float, mode: str):
+    """Rounded (effort, tdev, team size) for one size and mode"""
+    effort = float(COCOMO_EFFORT[mode](float(size_kloc)))
     
     # Development time estimate (TDEV)
-    tdev = 2.5 * (effort ** 0.38)
+    tdev = COCOMO_TDEV_A * math.pow(effort, COCOMO_TDEV_B)
     
     # Average team size
     team_size = effort / tdev if tdev > 0 else 1
     
+    return round(effort, 2), round(tdev, 2), round(team_size, 1)
+
+def cocomo_basic(size_kloc: float, mode: str) -> Dict:
+    """Enhanced COCOMO Basic model with detailed calculations"""
+    try:
+        coefficients = COCOMO_MODES[mode]
+    except KeyError:
+        raise ValueError(f"Invalid mode: {mode}")
+    
+    effort, tdev, team_size = _cocomo_cached(size_kloc, mode)
+    
     return {
-        "effort_person_months": round(effort, 2),
-        "development_time_months": round(tdev, 2),
-        "average_team_size": round(team_size, 1),
+        "effort_person_months": effort,
+        "development_time_months": tdev,
+        "average_team_size": team_size,
         "mode_description": coefficients["description"],
-        "coefficients": coefficients
+        "coefficients": dict(coefficients)
     }
 
+# Industry average productivity (hours per function point), keyed by the
+# result field it produces
+FP_PRODUCTIVITY_RATES = (
+    ("low_productivity", 20),      # Low productivity
+    ("average_productivity", 14),  # Industry average
+    ("high_productivity", 8),      # High productivity
+)
+HOURS_PER_PERSON_MONTH = 152
+
+@lru_cache(maxsize=4096)
+def _function_points_cached(ufp: int, caf: float):
+    """Rounded adjusted FP and (field, hours, person-months) per productivity level"""
+    adjusted_fp = ufp * caf
+    return round(adjusted_fp, 1), tuple(
+        (field, round(adjusted_fp * hours_per_fp, 1), round(adjusted_fp * hours_per_fp / HOURS_PER_PERSON_MONTH, 2))
+        for field, hours_per_fp in FP_PRODUCTIVITY_RATES
+    )
+
 def function_points_estimate(ufp: int, caf: float) -> Dict:
     """Enhanced Function Points estimation with productivity metrics"""
-    adjusted_fp = ufp * caf
-    
-    # Industry average productivity (hours per function point)
-    productivity_rates = {
-        "low": 20,      # Low productivity
-        "average": 14,  # Industry average
-        "high": 8       # High productivity
-    }
-    
-    estimates = {}
-    for level, hours_per_fp in productivity_rates.items():
-        total_hours = adjusted_fp * hours_per_fp
-        person_months = total_hours / 152  # Assuming 152 hours per person-month
-        estimates[f"{level}_productivity"] = {
-            "hours": round(total_hours, 1),
-            "person_months": round(person_months, 2)
-        }
+    adjusted_fp, levels = _function_points_cached(ufp, caf)
     
     return {
         "unadjusted_fp": ufp,
         "complexity_adjustment_factor": caf,
-        "adjusted_fp": round(adjusted_fp, 1),
-        "estimates": estimates
+        "adjusted_fp": adjusted_fp,
+        "estimates": {
+            field: {"hours": hours, "person_months": person_months}
+            for field, hours, person_months in levels
+        }
     }
 
 def expert_judgment_analysis(estimates: List[float]) -> Dict:
@@ -113,14 +175,14 @@ def expert_judgment_analysis(estimates: List[float]) -> Dict:
     if not estimates:
         raise ValueError("No estimates provided")
     
-    # Basic statistics
-    mean_estimate = statistics.mean(estimates)
-    median_estimate = statistics.median(estimates)
+    # Basic statistics from one pass; the median only needs a partial sort
+    values = np.asarray(estimates, dtype=np.float64)
+    mean_estimate, variance, min_estimate, max_estimate = welford_nb(values)
+    median_estimate = float(np.median(values))
     
     # Standard deviation and confidence intervals
     if len(estimates) > 1:
-        std_dev = statistics.stdev(estimates)
-        variance = statistics.variance(estimates)
+        std_dev = math.sqrt(variance)
         
         # 95% confidence interval (assuming normal distribution)
         margin_error = 1.96 * (std_dev / math.sqrt(len(estimates)))
@@ -138,8 +200,8 @@ def expert_judgment_analysis(estimates: List[float]) -> Dict:
         "standard_deviation": round(std_dev, 2),
         "variance": round(variance, 2),
         "confidence_interval_95": [round(ci, 2) for ci in confidence_interval],
-        "min_estimate": min(estimates),
-        "max_estimate": max(estimates)
+        "min_estimate": min_estimate,
+        "max_estimate": max_estimate
     }
 
 def delphi_method_analysis(estimates: List[float], rounds: int = 1) -> Dict:
@@ -147,35 +209,39 @@ def delphi_method_analysis(estimates: List[float], rounds: int = 1) -> Dict:
     if len(estimates) < 3:
         raise ValueError("Delphi method requires at least 3 estimates")
     
-    processed_estimates = estimates.copy()
+    # Working copy, trimmed in place round by round
+    processed = np.array(estimates, dtype=np.float64)
     round_results = []
     
     for round_num in range(rounds):
-        # Sort estimates
-        sorted_estimates = sorted(processed_estimates)
+        count = processed.size
         
-        # Remove outliers (extreme 10% on each end)
-        remove_count = max(1, len(sorted_estimates) // 10)
-        if len(sorted_estimates) > 2 * remove_count:
-            trimmed_estimates = sorted_estimates[remove_count:-remove_count]
+        # Remove outliers (extreme 10% on each end). Partitioning around the
+        # two cut ranks is enough, the kept values need not be sorted.
+        remove_count = max(1, count // 10)
+        if count > 2 * remove_count:
+            processed.partition([remove_count, count - remove_count - 1])
+            trimmed = processed[remove_count:count - remove_count]
         else:
-            trimmed_estimates = sorted_estimates
+            trimmed = processed
         
         # Calculate statistics for this round
-        mean_estimate = statistics.mean(trimmed_estimates)
-        consensus_level = 1 - (statistics.stdev(trimmed_estimates) / mean_estimate) if mean_estimate > 0 else 0
+        if trimmed.size < 2:
+            raise ValueError("Too few estimates left after outlier removal")
+        mean_estimate, variance, _, _ = welford_nb(trimmed)
+        consensus_level = 1 - (math.sqrt(variance) / mean_estimate) if mean_estimate > 0 else 0
         
         round_results.append({
             "round": round_num + 1,
-            "original_count": len(processed_estimates),
-            "trimmed_count": len(trimmed_estimates),
-            "removed_outliers": len(processed_estimates) - len(trimmed_estimates),
+            "original_count": count,
+            "trimmed_count": trimmed.size,
+            "removed_outliers": count - trimmed.size,
             "mean": round(mean_estimate, 2),
             "consensus_level": round(min(consensus_level, 1.0), 3)
         })
         
         # For multiple rounds, use the trimmed estimates for the next round
-        processed_estimates = trimmed_estimates
+        processed = trimmed
     
     final_result = round_results[-1]
     
@@ -187,7 +253,7 @@ def delphi_method_analysis(estimates: List[float], rounds: int = 1) -> Dict:
         "confidence": "High" if final_result["consensus_level"] > 0.8 else "Medium" if final_result["consensus_level"] > 0.6 else "Low"
     }
 
-def regression_analysis_estimate(size: float, historical_data: Optional[List[Dict[str, float]]] = None) -> Dict:
+def regression_analysis_estimate(size: float, historical_data: Optional[List[HistoricalPoint]] = None) -> Dict:
     """Enhanced regression analysis with correlation metrics"""
     
     # Default regression model if no historical data provided
@@ -214,25 +280,11 @@ def regression_analysis_estimate(size: float, historical_data: Optional[List[Dic
     if len(historical_data) < 2:
         raise ValueError("At least 2 historical data points required for regression")
     
-    sizes = [point.get("size", 0) for point in historical_data]
-    efforts = [point.get("effort", 0) for point in historical_data]
-    
-    n = len(sizes)
-    sum_x = sum(sizes)
-    sum_y = sum(efforts)
-    sum_xy = sum(x * y for x, y in zip(sizes, efforts))
-    sum_x2 = sum(x * x for x in sizes)
-    sum_y2 = sum(y * y for y in efforts)
-    
-    # Calculate slope and intercept
-    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
-    intercept = (sum_y - slope * sum_x) / n
+    n = len(historical_data)
+    x = np.fromiter((point.size for point in historical_data), dtype=np.float64, count=n)
+    y = np.fromiter((point.effort for point in historical_data), dtype=np.float64, count=n)
     
-    # Calculate R-squared
-    y_mean = sum_y / n
-    ss_tot = sum((y - y_mean) ** 2 for y in efforts)
-    ss_res = sum((y - (intercept + slope * x)) ** 2 for x, y in zip(sizes, efforts))
-    r_squared = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0
+    slope, intercept, r_squared = linreg_nb(x, y)
     
     # Estimate effort for given size
     effort = intercept + slope * size
@@ -246,9 +298,76 @@ def regression_analysis_estimate(size: float, historical_data: Optional[List[Dic
         "estimated_effort": round(effort, 2),
         "equation": f"Effort = {round(intercept, 3)} + {round(slope, 3)} * Size",
         "data_points": n,
-        "historical_data": historical_data
+        "historical_data": [point.model_dump() for point in historical_data]
     }
 
+# Headline effort figure (person-months) of each method's result, in summary order
+METHOD_ESTIMATE_EXTRACTORS = (
+    ("cocomo", lambda result: result.get("effort_person_months")),
+    ("function_points", lambda result: result.get("estimates", {}).get("average_productivity", {}).get("person_months")),
+    ("expert_judgment", lambda result: result.get("mean")),
+    ("delphi", lambda result: result.get("final_estimate")),
+    ("regression", lambda result: result.get("estimated_effort")),
+)
+
+def extract_method_estimates(results: Dict) -> List[float]:
+    """Headline effort of every successful method result in ``results``"""
+    values = []
+    for method, extract in METHOD_ESTIMATE_EXTRACTORS:
+        result = results.get(method)
+        if isinstance(result, dict) and "error" not in result:
+            value = extract(result)
+            if value is not None:
+                values.append(value)
+    return values
+
+def batch_estimate(input: BatchEstimationInput) -> Dict:
+    """COCOMO, Function Points and default regression estimates over arrays of projects"""
+    # Every provided list holds one entry per project
+    lengths = {len(values) for _, values in input if values is not None}
+    if len(lengths) > 1:
+        raise ValueError("All provided lists must have the same length")
+    
+    results = {}
+    
+    if input.size_kloc and input.mode:
+        sizes = np.asarray(input.size_kloc, dtype=np.float64)
+        modes = np.asarray(input.mode)
+        effort = np.empty_like(sizes)
+        # Dispatch once per mode, then run its kernel over all matching sizes
+        for mode in np.unique(modes):
+            mask = modes == mode
+            effort[mask] = COCOMO_EFFORT[str(mode)](sizes[mask])
+        tdev = COCOMO_TDEV_A * np.power(effort, COCOMO_TDEV_B)
+        results["cocomo"] = {
+            "effort_person_months": np.round(effort, 2).tolist(),
+            "development_time_months": np.round(tdev, 2).tolist(),
+            "average_team_size": np.round(effort / tdev, 1).tolist()
+        }
+    
+    if input.ufp and input.caf:
+        adjusted_fp = np.asarray(input.ufp, dtype=np.float64) * np.asarray(input.caf, dtype=np.float64)
+        estimates = {}
+        for field, hours_per_fp in FP_PRODUCTIVITY_RATES:
+            total_hours = adjusted_fp * hours_per_fp
+            estimates[field] = {
+                "hours": np.round(total_hours, 1).tolist(),
+                "person_months": np.round(total_hours / HOURS_PER_PERSON_MONTH, 2).tolist()
+            }
+        results["function_points"] = {
+            "adjusted_fp": np.round(adjusted_fp, 1).tolist(),
+            "estimates": estimates
+        }
+    
+    if input.regression_size:
+        # Same default linear model as regression_analysis_estimate
+        sizes = np.asarray(input.regression_size, dtype=np.float64)
+        results["regression"] = {
+            "estimated_effort": np.round(1.2 + 0.35 * sizes, 2).tolist()
+        }
+    
+    return results
+
 # --- Enhanced API Endpoints ---
 
 @router.post("/cocomo")
@@ -258,7 +377,7 @@ def estimate_cocomo(input: COCOMOInput):
         result = cocomo_basic(input.size_kloc, input.mode)
         return {
             "model": "COCOMO Basic",
-            "input": input.dict(),
+            "input": input.model_dump(),
             "result": result,
             "success": True
         }
@@ -272,7 +391,7 @@ def estimate_fp(input: FunctionPointInput):
         result = function_points_estimate(input.ufp, input.caf)
         return {
             "model": "Function Points",
-            "input": input.dict(),
+            "input": input.model_dump(),
             "result": result,
             "success": True
         }
@@ -286,7 +405,7 @@ def estimate_expert(input: ExpertJudgmentInput):
         result = expert_judgment_analysis(input.expert_estimates)
         return {
             "model": "Expert Judgment",
-            "input": input.dict(),
+            "input": input.model_dump(),
             "result": result,
             "success": True
         }
@@ -300,7 +419,7 @@ def estimate_delphi(input: DelphiInput):
         result = delphi_method_analysis(input.expert_estimates, input.rounds)
         return {
             "model": "Delphi Method",
-            "input": input.dict(),
+            "input": input.model_dump(),
             "result": result,
             "success": True
         }
@@ -314,13 +433,25 @@ def estimate_regression(input: RegressionInput):
         result = regression_analysis_estimate(input.size, input.historical_data)
         return {
             "model": "Regression Analysis",
-            "input": input.dict(),
+            "input": input.model_dump(),
             "result": result,
             "success": True
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/batch")
+def estimate_batch(input: BatchEstimationInput):
+    """Vectorized estimation for many projects in one request"""
+    try:
+        return fast_json({
+            "model": "Batch Estimation",
+            "results": batch_estimate(input),
+            "success": True
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/comprehensive")
 def estimate_comprehensive(input: ComprehensiveEstimationInput):
     """Comprehensive estimation using all available methods"""
@@ -358,86 +489,28 @@ def estimate_comprehensive(input: ComprehensiveEstimationInput):
             results["regression"] = {"error": str(e)}
     
     # Calculate summary statistics if multiple methods available
-    valid_estimates = []
-    for method, result in results.items():
-        if isinstance(result, dict) and "error" not in result:
-            if method == "cocomo":
-                valid_estimates.append(result.get("effort_person_months", 0))
-            elif method == "function_points":
-                # Use average productivity estimate
-                avg_estimate = result.get("estimates", {}).get("average_productivity", {}).get("person_months", 0)
-                valid_estimates.append(avg_estimate)
-            elif method == "expert_judgment":
-                valid_estimates.append(result.get("mean", 0))
-            elif method == "delphi":
-                valid_estimates.append(result.get("final_estimate", 0))
-            elif method == "regression":
-                valid_estimates.append(result.get("estimated_effort", 0))
+    valid_estimates = extract_method_estimates(results)
     
     summary = {}
     if valid_estimates:
         summary = {
             "methods_used": len(valid_estimates),
             "estimates": valid_estimates,
-            "average_estimate": round(sum(valid_estimates) / len(valid_estimates), 2),
+            "average_estimate": round(statistics.fmean(valid_estimates), 2),
             "min_estimate": min(valid_estimates),
             "max_estimate": max(valid_estimates),
             "estimate_range": round(max(valid_estimates) - min(valid_estimates), 2)
         }
     
-    return {
+    return fast_json({
         "project_name": input.project_name,
         "estimation_methods": results,
         "summary": summary,
         "success": True
-    }
-
-@router.post("/projects/", response_model=schemas.Project)
-async def create_project(
-    project: schemas.ProjectCreate,
-    db: Session = Depends(get_db),
-    current_user: schemas.User = Depends(get_current_user)
-):
-    """
-    Create a new project with cost estimations
-    """    # Calculate all estimates
-    estimates = {
-        "COCOMO": cocomo_basic(
-            project.attributes["size_kloc"],
-            project.attributes["mode"]
-        ),
-        "Function Points": function_points_estimate(
-            project.attributes["ufp"],
-            project.attributes["caf"]
-        ),
-        "Expert Judgment": expert_judgment_analysis(
-            project.attributes["expert_estimates"]
-        ),
-        "Delphi Method": delphi_method_analysis(
-            project.attributes["expert_estimates"]
-        ),
-        "Regression Analysis": regression_analysis_estimate(
-            project.attributes["regression_size"]
-        )
-    }
-    
-    # Create new project in database
-    db_project = models.Project(
-        name=project.name,
-        description=project.description,
-        attributes=project.attributes,
-        estimates=estimates,
-        user_id=current_user.id
-    )
-    
-    db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
-    
-    return db_project
+    })
 
 @router.get("/projects/", response_model=List[schemas.Project])
-async def get_user_projects(
+def get_user_projects(
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
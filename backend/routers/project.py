@@ -1,12 +1,20 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import case
 from sqlalchemy.orm import Session
 from datetime import datetime
+from statistics import fmean
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+import json
+import numpy as np
 
 from database import models
 from db import get_db
 import schemas
 from security import get_current_user
+from routers._responses import fast_json
 
 # Import estimation functions from cost_estimation router
 from routers.cost_estimation import (
@@ -14,13 +22,100 @@ from routers.cost_estimation import (
     function_points_estimate,
     expert_judgment_analysis,
     delphi_method_analysis,
-    regression_analysis_estimate
+    regression_analysis_estimate,
+    extract_method_estimates
 )
 
 router = APIRouter()
 
+# JSON path to each method's headline effort figure inside Project.estimates,
+# the SQL counterpart of cost_estimation.METHOD_ESTIMATE_EXTRACTORS
+COMPARE_ESTIMATE_PATHS = {
+    "cocomo": ("cocomo", "effort_person_months"),
+    "function_points": ("function_points", "estimates", "average_productivity", "person_months"),
+    "expert_judgment": ("expert_judgment", "mean"),
+    "delphi": ("delphi", "final_estimate"),
+    "regression": ("regression", "estimated_effort"),
+}
+
+def summarize_estimates(estimates: dict):
+    """Average effort across the estimation methods present and how many there are.
+
+    Methods with a zero figure are left out, as in the compare view.
+    """
+    estimates_list = [v for v in extract_method_estimates(estimates) if v]
+    estimated_cost = fmean(estimates_list) if estimates_list else None
+    return estimated_cost, len(estimates_list)
+
+def _method_figures(row) -> dict:
+    """Nonzero figure per method from a row with one column per COMPARE_ESTIMATE_PATHS entry"""
+    figures = {method: getattr(row, method) for method in COMPARE_ESTIMATE_PATHS}
+    return {method: value for method, value in figures.items() if value}
+
+def _run_estimates(attributes: dict) -> dict:
+    """Run every estimation method the inputs allow"""
+    estimates = {}
+    
+    # COCOMO estimation
+    if attributes.get("size_kloc") and attributes.get("mode"):
+        estimates["cocomo"] = cocomo_basic(attributes["size_kloc"], attributes["mode"])
+    
+    # Function Points estimation
+    if attributes.get("ufp") and attributes.get("caf"):
+        estimates["function_points"] = function_points_estimate(attributes["ufp"], attributes["caf"])
+    
+    # Expert Judgment and Delphi
+    expert_estimates = attributes.get("expert_estimates")
+    if expert_estimates:
+        estimates["expert_judgment"] = expert_judgment_analysis(expert_estimates)
+        
+        if len(expert_estimates) >= 3:
+            estimates["delphi"] = delphi_method_analysis(expert_estimates)
+    
+    # Regression Analysis
+    if attributes.get("regression_size"):
+        estimates["regression"] = regression_analysis_estimate(attributes["regression_size"])
+    
+    return estimates
+
+# Estimates JSON keyed by a digest of the inputs, least recently used first.
+# Digest keys stay small, but the expert judgment and Delphi results repeat
+# the whole panel, so the cached JSON is bounded in bytes as well as entries.
+ESTIMATE_CACHE_SIZE = 2048
+ESTIMATE_CACHE_BYTES = 8 * 1024 * 1024
+_estimate_cache = OrderedDict()
+_estimate_cache_bytes = 0
+_estimate_cache_lock = Lock()
+
+def cached_estimates(attributes: dict) -> dict:
+    """Estimates for ``attributes``, reusing earlier runs of identical inputs.
+
+    Client retries and auto-saves skip the pipeline. The cache holds JSON, so
+    every caller gets its own copy.
+    """
+    global _estimate_cache_bytes
+    key = blake2b(json.dumps(attributes, sort_keys=True).encode(), digest_size=16).digest()
+    with _estimate_cache_lock:
+        cached = _estimate_cache.get(key)
+        if cached is not None:
+            _estimate_cache.move_to_end(key)
+    
+    if cached is None:
+        cached = json.dumps(_run_estimates(attributes))
+        with _estimate_cache_lock:
+            previous = _estimate_cache.pop(key, None)
+            if previous is not None:
+                _estimate_cache_bytes -= len(previous)
+            _estimate_cache[key] = cached
+            _estimate_cache_bytes += len(cached)
+            while len(_estimate_cache) > ESTIMATE_CACHE_SIZE or _estimate_cache_bytes > ESTIMATE_CACHE_BYTES:
+                _, evicted = _estimate_cache.popitem(last=False)
+                _estimate_cache_bytes -= len(evicted)
+    
+    return json.loads(cached)
+
 @router.post("/", response_model=schemas.Project)
-async def create_project(
+def create_project(
     project: schemas.ProjectCreate,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
@@ -31,7 +126,8 @@ async def create_project(
         description=project.description,
         user_id=current_user.id,
         attributes={},
-        estimates={}
+        estimates={},
+        estimation_methods_count=0
     )
     
     db.add(db_project)
@@ -41,56 +137,49 @@ async def create_project(
     return db_project
 
 @router.get("/", response_model=List[schemas.ProjectSummary])
-async def get_user_projects(
+def get_user_projects(
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100)
 ):
     """Get all projects for the current user with summary information"""
-    projects = db.query(models.Project).filter(
+    # Rows estimated before the summary columns existed have a NULL count;
+    # for those only, pull each method's figure out of the JSON in SQL
+    legacy = models.Project.estimation_methods_count.is_(None)
+    legacy_columns = [
+        case((legacy, models.Project.estimates[path].as_float()), else_=None).label(method)
+        for method, path in COMPARE_ESTIMATE_PATHS.items()
+    ]
+    rows = db.query(
+        models.Project.id,
+        models.Project.name,
+        models.Project.description,
+        models.Project.created_at,
+        models.Project.updated_at,
+        models.Project.estimated_cost,
+        models.Project.estimation_methods_count,
+        *legacy_columns,
+    ).filter(
         models.Project.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
+    ).offset(skip).limit(limit).yield_per(50)
     
+    # Summaries are built as rows stream in from the cursor
     project_summaries = []
-    for project in projects:
-        # Calculate estimated cost from estimates if available
-        estimated_cost = None
-        estimation_methods_count = 0
-        
-        if project.estimates:
-            estimates_list = []
-            if "cocomo" in project.estimates and "effort_person_months" in project.estimates["cocomo"]:
-                estimates_list.append(project.estimates["cocomo"]["effort_person_months"])
-                estimation_methods_count += 1
-            
-            if "function_points" in project.estimates and "estimates" in project.estimates["function_points"]:
-                fp_avg = project.estimates["function_points"]["estimates"].get("average_productivity", {}).get("person_months")
-                if fp_avg:
-                    estimates_list.append(fp_avg)
-                    estimation_methods_count += 1
-            
-            if "expert_judgment" in project.estimates and "mean" in project.estimates["expert_judgment"]:
-                estimates_list.append(project.estimates["expert_judgment"]["mean"])
-                estimation_methods_count += 1
-            
-            if "delphi" in project.estimates and "final_estimate" in project.estimates["delphi"]:
-                estimates_list.append(project.estimates["delphi"]["final_estimate"])
-                estimation_methods_count += 1
-            
-            if "regression" in project.estimates and "estimated_effort" in project.estimates["regression"]:
-                estimates_list.append(project.estimates["regression"]["estimated_effort"])
-                estimation_methods_count += 1
-            
-            if estimates_list:
-                estimated_cost = sum(estimates_list) / len(estimates_list)
+    for row in rows:
+        estimated_cost = row.estimated_cost
+        estimation_methods_count = row.estimation_methods_count
+        if estimation_methods_count is None:
+            values = list(_method_figures(row).values())
+            estimated_cost = fmean(values) if values else None
+            estimation_methods_count = len(values)
         
         project_summaries.append(schemas.ProjectSummary(
-            id=project.id,
-            name=project.name,
-            description=project.description,
-            created_at=project.created_at,
-            updated_at=project.updated_at,
+            id=row.id,
+            name=row.name,
+            description=row.description,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
             estimated_cost=estimated_cost,
             estimation_methods_count=estimation_methods_count
         ))
@@ -98,7 +187,7 @@ async def get_user_projects(
     return project_summaries
 
 @router.get("/{project_id}", response_model=schemas.Project)
-async def get_project(
+def get_project(
     project_id: int,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
@@ -115,7 +204,7 @@ async def get_project(
     return project
 
 @router.put("/{project_id}", response_model=schemas.Project)
-async def update_project(
+def update_project(
     project_id: int,
     project_update: schemas.ProjectUpdate,
     db: Session = Depends(get_db),
@@ -130,10 +219,17 @@ async def update_project(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if project_update.name is not None:
+    changed = False
+    if project_update.name is not None and project_update.name != project.name:
         project.name = project_update.name
-    if project_update.description is not None:
+        changed = True
+    if project_update.description is not None and project_update.description != project.description:
         project.description = project_update.description
+        changed = True
+    
+    # Nothing to write for a no-op update
+    if not changed:
+        return project
     
     project.updated_at = datetime.utcnow()
     
@@ -143,7 +239,7 @@ async def update_project(
     return project
 
 @router.delete("/{project_id}")
-async def delete_project(
+def delete_project(
     project_id: int,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
@@ -163,7 +259,7 @@ async def delete_project(
     return {"message": "Project deleted successfully"}
 
 @router.post("/{project_id}/estimate")
-async def estimate_project_cost(
+def estimate_project_cost(
     project_id: int,
     estimation_input: schemas.EstimationInput,
     db: Session = Depends(get_db),
@@ -178,48 +274,32 @@ async def estimate_project_cost(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Perform estimations based on provided inputs
-    estimates = {}
-    
     try:
-        # COCOMO estimation
-        if estimation_input.size_kloc and estimation_input.mode:
-            estimates["cocomo"] = cocomo_basic(estimation_input.size_kloc, estimation_input.mode)
-        
-        # Function Points estimation
-        if estimation_input.ufp and estimation_input.caf:
-            estimates["function_points"] = function_points_estimate(estimation_input.ufp, estimation_input.caf)
+        attributes = estimation_input.model_dump(exclude_none=True)
+        estimates = cached_estimates(attributes)
         
-        # Expert Judgment and Delphi
-        if estimation_input.expert_estimates and len(estimation_input.expert_estimates) > 0:
-            estimates["expert_judgment"] = expert_judgment_analysis(estimation_input.expert_estimates)
+        # Update project with new estimates and attributes, unless a re-run
+        # produced exactly what is already stored
+        if attributes != project.attributes or estimates != project.estimates:
+            project.attributes = attributes
+            project.estimates = estimates
+            # Keep the list view's summary columns in step with the estimates
+            project.estimated_cost, project.estimation_methods_count = summarize_estimates(estimates)
+            project.updated_at = datetime.utcnow()
             
-            if len(estimation_input.expert_estimates) >= 3:
-                estimates["delphi"] = delphi_method_analysis(estimation_input.expert_estimates)
-        
-        # Regression Analysis
-        if estimation_input.regression_size:
-            estimates["regression"] = regression_analysis_estimate(estimation_input.regression_size)
+            db.commit()
         
-        # Update project with new estimates and attributes
-        project.attributes = estimation_input.dict(exclude_none=True)
-        project.estimates = estimates
-        project.updated_at = datetime.utcnow()
-        
-        db.commit()
-        db.refresh(project)
-        
-        return {
+        return fast_json({
             "project_id": project_id,
             "estimates": estimates,
             "message": "Cost estimation completed successfully"
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error in cost estimation: {str(e)}")
 
 @router.get("/compare/")
-async def compare_projects(
+def compare_projects(
     project_ids: List[int] = Query(..., description="List of project IDs to compare"),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
@@ -228,78 +308,55 @@ async def compare_projects(
     if len(project_ids) < 2:
         raise HTTPException(status_code=400, detail="At least 2 projects required for comparison")
     
-    projects = db.query(models.Project).filter(
+    # Pull each method's headline number straight out of the JSON in SQL
+    method_columns = {
+        method: models.Project.estimates[path].as_float().label(method)
+        for method, path in COMPARE_ESTIMATE_PATHS.items()
+    }
+    rows = db.query(
+        models.Project.id,
+        models.Project.name,
+        models.Project.description,
+        models.Project.created_at,
+        *method_columns.values(),
+    ).filter(
         models.Project.id.in_(project_ids),
         models.Project.user_id == current_user.id
     ).all()
     
-    if len(projects) != len(project_ids):
+    if len(rows) != len(project_ids):
         raise HTTPException(status_code=404, detail="One or more projects not found")
     
     comparison_data = []
-    
-    for project in projects:
-        project_data = {
-            "id": project.id,
-            "name": project.name,
-            "description": project.description,
-            "created_at": project.created_at,
-            "estimates": {},
-            "average_estimate": None
-        }
-        
-        if project.estimates:
-            estimates_list = []
-            
-            # Extract estimates from different methods
-            if "cocomo" in project.estimates:
-                effort = project.estimates["cocomo"].get("effort_person_months")
-                if effort:
-                    project_data["estimates"]["cocomo"] = effort
-                    estimates_list.append(effort)
-            
-            if "function_points" in project.estimates:
-                fp_avg = project.estimates["function_points"].get("estimates", {}).get("average_productivity", {}).get("person_months")
-                if fp_avg:
-                    project_data["estimates"]["function_points"] = fp_avg
-                    estimates_list.append(fp_avg)
-            
-            if "expert_judgment" in project.estimates:
-                ej_mean = project.estimates["expert_judgment"].get("mean")
-                if ej_mean:
-                    project_data["estimates"]["expert_judgment"] = ej_mean
-                    estimates_list.append(ej_mean)
-            
-            if "delphi" in project.estimates:
-                delphi_est = project.estimates["delphi"].get("final_estimate")
-                if delphi_est:
-                    project_data["estimates"]["delphi"] = delphi_est
-                    estimates_list.append(delphi_est)
-            
-            if "regression" in project.estimates:
-                reg_est = project.estimates["regression"].get("estimated_effort")
-                if reg_est:
-                    project_data["estimates"]["regression"] = reg_est
-                    estimates_list.append(reg_est)
-            
-            # Calculate average estimate
-            if estimates_list:
-                project_data["average_estimate"] = sum(estimates_list) / len(estimates_list)
-        
-        comparison_data.append(project_data)
+    for row in rows:
+        # The average covers exactly the figures listed
+        method_estimates = _method_figures(row)
+        average_estimate = fmean(method_estimates.values()) if method_estimates else None
+        comparison_data.append({
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "created_at": row.created_at,
+            "estimates": method_estimates,
+            "average_estimate": average_estimate
+        })
     
     # Calculate comparison statistics
-    all_averages = [p["average_estimate"] for p in comparison_data if p["average_estimate"] is not None]
+    all_averages = np.array(
+        [p["average_estimate"] for p in comparison_data if p["average_estimate"] is not None],
+        dtype=np.float64,
+    )
+    has_estimates = all_averages.size > 0
     
     comparison_summary = {
         "projects": comparison_data,
         "summary": {
             "total_projects": len(comparison_data),
-            "projects_with_estimates": len(all_averages),
-            "min_estimate": min(all_averages) if all_averages else None,
-            "max_estimate": max(all_averages) if all_averages else None,
-            "average_estimate": sum(all_averages) / len(all_averages) if all_averages else None
+            "projects_with_estimates": int(all_averages.size),
+            "min_estimate": float(all_averages.min()) if has_estimates else None,
+            "max_estimate": float(all_averages.max()) if has_estimates else None,
+            "average_estimate": float(all_averages.mean()) if has_estimates else None
         }
     }
     
-    return comparison_summary
\ No newline at end of file
+    return fast_json(comparison_summary)
@@ -1,17 +1,30 @@
 from typing import List, Dict, Optional, Any
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 from pydantic import BaseModel, Field
 import numpy as np
 from datetime import datetime, timedelta
+from collections import deque
+from hashlib import blake2b
 import json
 
 from database import models
 from db import get_db
 from security import get_current_user
+from routers._resource_kernels import find_best_slot_nb, find_least_contention_slot_nb
 
 router = APIRouter()
 
+# Bounds on project size and scenario sweeps keep the worst-case work per request fixed
+MAX_RESOURCES = 100
+MAX_TASKS = 1000
+MAX_SCENARIO_VARIATIONS = 20
+MAX_HORIZON_HOURS = 24 * 365 * 5
+
+# Leveling order of task priorities; unknown priorities rank as 'medium'
+TASK_PRIORITY_RANK = {'critical': 4, 'high': 3, 'medium': 2, 'low': 1}
+
 class ResourceInput(BaseModel):
     id: str
     name: str
@@ -23,7 +36,7 @@ class ResourceInput(BaseModel):
 class TaskInput(BaseModel):
     id: str
     name: str
-    duration: float  # hours
+    duration: float = Field(..., allow_inf_nan=False)  # hours
     required_resources: List[Dict[str, Any]]  # resource_id, quantity
     dependencies: List[str]
     priority: str  # 'low', 'medium', 'high', 'critical'
@@ -35,91 +48,114 @@ class OptimizationScenario(BaseModel):
     weights: Dict[str, float]
 
 class OptimizationInput(BaseModel):
-    resources: List[ResourceInput]
-    tasks: List[TaskInput]
+    resources: List[ResourceInput] = Field(..., max_length=MAX_RESOURCES)
+    tasks: List[TaskInput] = Field(..., max_length=MAX_TASKS)
     scenario: OptimizationScenario
     project_start_date: str
 
 class ResourceLevelingInput(BaseModel):
-    resources: List[ResourceInput]
-    tasks: List[TaskInput]
+    resources: List[ResourceInput] = Field(..., max_length=MAX_RESOURCES)
+    tasks: List[TaskInput] = Field(..., max_length=MAX_TASKS)
     project_start_date: str
 
 class ResourceSmoothingInput(BaseModel):
-    resources: List[ResourceInput]
-    tasks: List[TaskInput]
+    resources: List[ResourceInput] = Field(..., max_length=MAX_RESOURCES)
+    tasks: List[TaskInput] = Field(..., max_length=MAX_TASKS)
     project_start_date: str
 
 class ResourceAllocationInput(BaseModel):
-    resources: List[ResourceInput]
-    tasks: List[TaskInput]
+    resources: List[ResourceInput] = Field(..., max_length=MAX_RESOURCES)
+    tasks: List[TaskInput] = Field(..., max_length=MAX_TASKS)
     scenario: OptimizationScenario
     project_start_date: str
 
 class ScenarioAnalysisInput(BaseModel):
     base_scenario: OptimizationInput
-    variations: Dict[str, Dict[str, float]]  # scenario_name -> {param: factor}
+    variations: Dict[str, Dict[str, float]] = Field(..., max_length=MAX_SCENARIO_VARIATIONS)  # scenario_name -> {param: factor}
 
-def resource_leveling_algorithm(tasks: List[TaskInput], resources: List[ResourceInput], start_date: datetime) -> Dict:
-    """
-    Resource leveling algorithm - delays non-critical tasks to resolve resource over-allocations
-    while maintaining the project end date
-    """
-    # Build dependency graph and calculate critical path
+def _usage_by_slot(usage: np.ndarray, resource_index: Dict[str, int], used_resources) -> Dict:
+    """Non-zero hours of each used resource's row in the usage matrix"""
+    resource_usage = {}
+    for res_id in used_resources:
+        row = usage[resource_index[res_id]]
+        slots = np.flatnonzero(row)
+        resource_usage[res_id] = dict(zip(slots.tolist(), row[slots].tolist()))
+    return resource_usage
+
+def _hours_isoformat(start_date: datetime, hours: float) -> str:
+    """ISO timestamp ``hours`` after ``start_date``"""
+    return (start_date + timedelta(hours=hours)).isoformat()
+
+def _critical_path_times(tasks: List[TaskInput]):
+    """Earliest and latest start of every task, in hours from the project start"""
     task_dict = {task.id: task for task in tasks}
-    resource_dict = {res.id: res for res in resources}
+    
+    # Order tasks so every task follows its dependencies (Kahn's algorithm);
+    # dependencies on unknown task ids are ignored
+    successors = {task_id: [] for task_id in task_dict}
+    in_degree = dict.fromkeys(task_dict, 0)
+    for task in task_dict.values():
+        for dep_id in dict.fromkeys(task.dependencies):
+            if dep_id in task_dict:
+                successors[dep_id].append(task.id)
+                in_degree[task.id] += 1
+    
+    ready = deque(task_id for task_id, degree in in_degree.items() if degree == 0)
+    order = []
+    while ready:
+        task_id = ready.popleft()
+        order.append(task_id)
+        for successor_id in successors[task_id]:
+            in_degree[successor_id] -= 1
+            if in_degree[successor_id] == 0:
+                ready.append(successor_id)
+    
+    if len(order) < len(task_dict):
+        raise ValueError("Task dependencies contain a cycle")
     
     # Calculate earliest start times using forward pass
     earliest_start = {}
     earliest_finish = {}
-    
-    def calculate_earliest_times(task_id: str, visited: set):
-        if task_id in visited:
-            return earliest_finish.get(task_id, 0)
-        visited.add(task_id)
-        
+    for task_id in order:
         task = task_dict[task_id]
         max_predecessor_finish = 0
-        
         for dep_id in task.dependencies:
             if dep_id in task_dict:
-                dep_finish = calculate_earliest_times(dep_id, visited)
-                max_predecessor_finish = max(max_predecessor_finish, dep_finish)
+                max_predecessor_finish = max(max_predecessor_finish, earliest_finish[dep_id])
         
         earliest_start[task_id] = max_predecessor_finish
         earliest_finish[task_id] = max_predecessor_finish + task.duration
-        return earliest_finish[task_id]
-    
-    # Calculate for all tasks
-    for task in tasks:
-        calculate_earliest_times(task.id, set())
     
     # Calculate latest start times using backward pass
     project_end = max(earliest_finish.values()) if earliest_finish else 0
     latest_start = {}
-    latest_finish = {}
-    
-    def calculate_latest_times(task_id: str, visited: set):
-        if task_id in visited:
-            return latest_start.get(task_id, project_end)
-        visited.add(task_id)
-        
-        task = task_dict[task_id]
+    for task_id in reversed(order):
         min_successor_start = project_end
+        for successor_id in successors[task_id]:
+            min_successor_start = min(min_successor_start, latest_start[successor_id])
         
-        # Find all tasks that depend on this task
-        for other_task in tasks:
-            if task_id in other_task.dependencies:
-                successor_start = calculate_latest_times(other_task.id, visited)
-                min_successor_start = min(min_successor_start, successor_start)
-        
-        latest_finish[task_id] = min_successor_start
-        latest_start[task_id] = min_successor_start - task.duration
-        return latest_start[task_id]
+        latest_start[task_id] = min_successor_start - task_dict[task_id].duration
     
-    # Calculate for all tasks
-    for task in tasks:
-        calculate_latest_times(task.id, set())
+    return earliest_start, latest_start
+
+def _schedule_horizon(tasks: List[TaskInput], earliest_start: Dict, latest_start: Dict) -> int:
+    """Hours of usage matrix needed to place every task anywhere within its float"""
+    horizon = max(
+        (int(max(earliest_start[task.id], latest_start[task.id])) + max(int(task.duration), 0) + 1 for task in tasks),
+        default=0
+    )
+    if horizon > MAX_HORIZON_HOURS:
+        raise ValueError(f"Schedule exceeds the {MAX_HORIZON_HOURS} hour planning horizon")
+    return horizon
+
+def resource_leveling_algorithm(tasks: List[TaskInput], resources: List[ResourceInput], start_date: datetime) -> Dict:
+    """
+    Resource leveling algorithm - delays non-critical tasks to resolve resource over-allocations
+    while maintaining the project end date
+    """
+    # Build dependency graph and calculate critical path
+    resource_dict = {res.id: res for res in resources}
+    earliest_start, latest_start = _critical_path_times(tasks)
     
     # Identify critical path
     critical_tasks = []
@@ -129,13 +165,19 @@ def resource_leveling_algorithm(tasks: List[TaskInput], resources: List[Resource
     
     # Resource leveling: adjust non-critical tasks to smooth resource usage
     schedule = {}
-    resource_usage = {}
+    
+    # Usage per resource (rows) and whole hour from the project start (columns)
+    resource_index = {res.id: i for i, res in enumerate(resources)}
+    capacities = np.array([res.capacity for res in resources], dtype=np.float64)
+    usage = np.zeros((len(resources), _schedule_horizon(tasks, earliest_start, latest_start)), dtype=np.float64)
+    used_resources = {}
     
     # Sort tasks by priority and float (non-critical first for adjustment)
+    critical_set = set(critical_tasks)
+    
     def task_priority(task):
-        is_critical = task.id in critical_tasks
-        priority_map = {'critical': 4, 'high': 3, 'medium': 2, 'low': 1}
-        return (is_critical, priority_map.get(task.priority, 2), earliest_start[task.id])
+        is_critical = task.id in critical_set
+        return (is_critical, TASK_PRIORITY_RANK.get(task.priority, 2), earliest_start[task.id])
     
     sorted_tasks = sorted(tasks, key=task_priority)
     
@@ -145,68 +187,47 @@ def resource_leveling_algorithm(tasks: List[TaskInput], resources: List[Resource
         for req in task.required_resources:
             if req['resource_id'] in resource_dict:
                 task_resources[req['resource_id']] = req['quantity']
+        rows = np.array([resource_index[res_id] for res_id in task_resources], dtype=np.intp)
+        quantities = np.array(list(task_resources.values()), dtype=np.float64)
+        used_resources.update(dict.fromkeys(task_resources))
         
         # Find optimal start time within float
         min_start = earliest_start[task.id]
         max_start = latest_start[task.id]
-        
-        best_start = min_start
-        min_peak_usage = float('inf')
+        base = int(min_start)
+        hours = int(task.duration)
+        candidates = int(max_start - min_start) + 1
         
         # Try different start times within the float
-        for start_offset in range(int(max_start - min_start) + 1):
-            candidate_start = min_start + start_offset
-            candidate_end = candidate_start + task.duration
-            
-            # Calculate resource usage for this time slot
-            peak_usage = 0
-            conflict = False
-            
-            for res_id, quantity in task_resources.items():
-                resource = resource_dict[res_id]
-                for hour in range(int(task.duration)):
-                    time_slot = candidate_start + hour
-                    current_usage = resource_usage.get(res_id, {}).get(time_slot, 0)
-                    new_usage = current_usage + quantity
-                    
-                    if new_usage > resource.capacity:
-                        conflict = True
-                        break
-                    peak_usage = max(peak_usage, new_usage)
-                
-                if conflict:
-                    break
-            
-            if not conflict and peak_usage < min_peak_usage:
-                min_peak_usage = peak_usage
-                best_start = candidate_start
+        best_offset = find_best_slot_nb(usage, rows, quantities, capacities, base, candidates, hours)
+        best_start = min_start + best_offset
         
         # Schedule the task
         schedule[task.id] = {
-            'start_time': start_date + timedelta(hours=best_start),
-            'end_time': start_date + timedelta(hours=best_start + task.duration),
+            'start': best_start,
+            'end': best_start + task.duration,
             'duration': task.duration,
-            'is_critical': task.id in critical_tasks,
+            'is_critical': task.id in critical_set,
             'float': latest_start[task.id] - earliest_start[task.id]
         }
         
         # Update resource usage
-        for res_id, quantity in task_resources.items():
-            if res_id not in resource_usage:
-                resource_usage[res_id] = {}
-            for hour in range(int(task.duration)):
-                time_slot = best_start + hour
-                resource_usage[res_id][time_slot] = resource_usage[res_id].get(time_slot, 0) + quantity
+        if hours > 0:
+            usage[rows, base + best_offset:base + best_offset + hours] += quantities[:, None]
+    
+    resource_usage = _usage_by_slot(usage, resource_index, used_resources)
       # Calculate project duration as hours (JSON-serializable)
-    project_end_time = max(schedule[task.id]['end_time'] for task in tasks if task.id in schedule)
+    project_end_time = start_date + timedelta(hours=max(schedule[task.id]['end'] for task in tasks))
     project_duration_hours = (project_end_time - start_date).total_seconds() / 3600
     
+    # TaskInput fields are all plain values, so its attribute dict is what
+    # model_dump() would return, without the per-task serializer pass
     return {
         'leveled_tasks': [
             {
-                **task.dict(),
-                'earliest_start': schedule[task.id]['start_time'].isoformat(),
-                'latest_finish': schedule[task.id]['end_time'].isoformat(),
+                **task.__dict__,
+                'earliest_start': _hours_isoformat(start_date, schedule[task.id]['start']),
+                'latest_finish': _hours_isoformat(start_date, schedule[task.id]['end']),
                 'is_critical': schedule[task.id]['is_critical'],
                 'float': schedule[task.id]['float']
             }
@@ -246,7 +267,14 @@ def resource_smoothing_algorithm(tasks: List[TaskInput], resources: List[Resourc
     
     # Smooth resources by delaying non-critical tasks
     smoothed_schedule = {}
-    smoothed_usage = {}
+    earliest_start, latest_start = _critical_path_times(tasks)
+    
+    # Usage matrix of resources by hours from the project start, with the
+    # contention threshold per resource at 70% target utilization
+    resource_index = {res.id: i for i, res in enumerate(resources)}
+    targets = np.array([res.capacity * 0.7 for res in resources], dtype=np.float64)
+    usage = np.zeros((len(resources), _schedule_horizon(tasks, earliest_start, latest_start)), dtype=np.float64)
+    used_resources = {}
     
     # Re-schedule tasks with smoothing objective
     for task in tasks:
@@ -254,68 +282,58 @@ def resource_smoothing_algorithm(tasks: List[TaskInput], resources: List[Resourc
         for req in task.required_resources:
             if req['resource_id'] in resource_dict:
                 task_resources[req['resource_id']] = req['quantity']
+        rows = np.array([resource_index[res_id] for res_id in task_resources], dtype=np.intp)
+        quantities = np.array(list(task_resources.values()), dtype=np.float64)
+        used_resources.update(dict.fromkeys(task_resources))
         
-        # Find the time slot with minimum resource contention
-        best_start = leveled_result['leveled_tasks'][0]['earliest_start']  # Default
-        min_contention = float('inf')
-          # Try different start times (more flexible for smoothing)
-        # Use the duration in hours from leveled result
-        max_project_hours = int(leveled_result['project_duration_hours'])
-        for start_offset in range(0, max_project_hours):
-            candidate_start = start_offset
-            total_contention = 0
-            
-            for res_id, quantity in task_resources.items():
-                resource = resource_dict[res_id]
-                for hour in range(int(task.duration)):
-                    time_slot = candidate_start + hour
-                    current_usage = smoothed_usage.get(res_id, {}).get(time_slot, 0)
-                    new_usage = current_usage + quantity
-                    
-                    # Calculate contention as usage above target utilization (70%)
-                    target_utilization = 0.7
-                    if new_usage > resource.capacity * target_utilization:
-                        total_contention += (new_usage - resource.capacity * target_utilization)
-            
-            if total_contention < min_contention:
-                min_contention = total_contention
-                best_start = candidate_start
+        # Each task may only move within its float, as in leveling
+        min_start = earliest_start[task.id]
+        base = int(min_start)
+        hours = int(task.duration)
+        candidates = int(latest_start[task.id] - min_start) + 1
+        
+        if not task_resources or hours <= 0:
+            # The task occupies nothing, so every start is contention-free
+            # and the search would settle on the first one
+            best_offset = 0
+        else:
+            # Find the time slot with minimum resource contention
+            best_offset = find_least_contention_slot_nb(usage, rows, quantities, targets, base, candidates, hours)
+        best_start = min_start + best_offset
         
         # Schedule the task
         smoothed_schedule[task.id] = {
-            'start_time': start_date + timedelta(hours=best_start),
-            'end_time': start_date + timedelta(hours=best_start + task.duration),
+            'start': best_start,
+            'end': best_start + task.duration,
             'duration': task.duration
         }
         
         # Update resource usage
-        for res_id, quantity in task_resources.items():
-            if res_id not in smoothed_usage:
-                smoothed_usage[res_id] = {}
-            for hour in range(int(task.duration)):
-                time_slot = best_start + hour
-                smoothed_usage[res_id][time_slot] = smoothed_usage[res_id].get(time_slot, 0) + quantity
-    
-    # Calculate new resource utilization
+        if hours > 0:
+            usage[rows, base + best_offset:base + best_offset + hours] += quantities[:, None]
+    smoothed_usage = _usage_by_slot(usage, resource_index, used_resources)
+    
+    # Calculate new resource utilization from each row's peak over its used hours
+    peaks = usage.max(axis=1, initial=-np.inf, where=usage != 0)
     smoothed_peaks = {}
-    for res_id, usage in smoothed_usage.items():
-        if usage:
-            max_usage = max(usage.values())
+    for res_id in smoothed_usage:
+        max_usage = float(peaks[resource_index[res_id]])
+        if max_usage > -np.inf:
             smoothed_peaks[res_id] = {
                 'peak_usage': max_usage,
                 'capacity': resource_dict[res_id].capacity,
                 'utilization': max_usage / resource_dict[res_id].capacity
             }
       # Calculate project duration as hours (JSON-serializable)
-    project_end_time = max(smoothed_schedule[task.id]['end_time'] for task in tasks if task.id in smoothed_schedule)
+    project_end_time = start_date + timedelta(hours=max(smoothed_schedule[task.id]['end'] for task in tasks))
     project_duration_hours = (project_end_time - start_date).total_seconds() / 3600
     
     return {
         'smoothed_tasks': [
             {
-                **task.dict(),
-                'earliest_start': smoothed_schedule[task.id]['start_time'].isoformat(),
-                'latest_finish': smoothed_schedule[task.id]['end_time'].isoformat()
+                **task.__dict__,
+                'earliest_start': _hours_isoformat(start_date, smoothed_schedule[task.id]['start']),
+                'latest_finish': _hours_isoformat(start_date, smoothed_schedule[task.id]['end'])
             }
             for task in tasks
         ],
@@ -327,32 +345,52 @@ def resource_smoothing_algorithm(tasks: List[TaskInput], resources: List[Resourc
         'project_end_date': project_end_time.isoformat()
     }
 
-def optimize_resource_allocation(input_data: OptimizationInput) -> Dict:
+def optimize_resource_allocation(
+    input_data: OptimizationInput, leveled_result: Optional[Dict] = None, cost_factor: float = 1.0
+) -> Dict:
     """
-    Comprehensive resource optimization based on scenario objectives
+    Comprehensive resource optimization based on scenario objectives.
+    Pass ``leveled_result`` to reuse a leveling run of the same tasks and resources;
+    ``cost_factor`` scales every resource's hourly cost.
     """
     start_date = datetime.fromisoformat(input_data.project_start_date)
     scenario = input_data.scenario
     
-    # Calculate baseline metrics
+    # Resource lookup by id; the first definition of a repeated id wins
+    resource_dict = {res.id: res for res in reversed(input_data.resources)}
+    
+    # Calculate baseline metrics and the per-requirement allocations in one pass
     total_estimated_cost = 0
     total_duration = 0
     resource_requirements = {}
+    allocations = []
+    project_start = start_date.isoformat()
     
     for task in input_data.tasks:
         total_duration += task.duration
+        task_end = (start_date + timedelta(hours=task.duration)).isoformat()
         for req in task.required_resources:
-            resource = next((r for r in input_data.resources if r.id == req['resource_id']), None)
+            resource = resource_dict.get(req['resource_id'])
             if resource:
-                task_cost = task.duration * resource.cost_per_hour * req['quantity']
+                task_cost = task.duration * (resource.cost_per_hour * cost_factor) * req['quantity']
                 total_estimated_cost += task_cost
                 
                 if req['resource_id'] not in resource_requirements:
                     resource_requirements[req['resource_id']] = 0
                 resource_requirements[req['resource_id']] += req['quantity']
+                
+                allocations.append({
+                    'task_id': task.id,
+                    'resource_id': req['resource_id'],
+                    'start_date': project_start,
+                    'end_date': task_end,
+                    'hours_allocated': task.duration * req['quantity'],
+                    'cost': task_cost
+                })
     
     # Apply resource leveling first
-    leveled_result = resource_leveling_algorithm(input_data.tasks, input_data.resources, start_date)
+    if leveled_result is None:
+        leveled_result = resource_leveling_algorithm(input_data.tasks, input_data.resources, start_date)
     
     # Calculate optimized schedule based on objective
     if scenario.objective == 'minimize_cost':
@@ -372,8 +410,7 @@ def optimize_resource_allocation(input_data: OptimizationInput) -> Dict:
             "Reduce task dependencies where possible"
         ]
     elif scenario.objective == 'balance_resources':
-        # Apply smoothing for balanced utilization
-        smoothed_result = resource_smoothing_algorithm(input_data.tasks, input_data.resources, start_date)
+        # Balanced utilization; the smoothed schedule itself comes from /smoothing
         recommendations = [
             "Balance resource utilization across project timeline",
             "Avoid resource peaks and troughs",
@@ -394,35 +431,32 @@ def optimize_resource_allocation(input_data: OptimizationInput) -> Dict:
         used_capacity = resource_requirements.get(resource.id, 0)
         resource_utilization[resource.id] = min(used_capacity / total_capacity, 1.0) if total_capacity > 0 else 0
     
-    # Identify conflicts (simplified)
+    # Identify conflicts as runs of consecutive over-allocated hours
     resource_conflicts = []
     for res_id, peak_data in leveled_result.get('resource_usage', {}).items():
-        resource = next((r for r in input_data.resources if r.id == res_id), None)
+        resource = resource_dict.get(res_id)
         if resource and peak_data:
-            max_usage = max(peak_data.values()) if peak_data else 0
-            if max_usage > resource.capacity:
+            # Leveled usage is keyed by hour offset in ascending order
+            hours = np.fromiter(peak_data.keys(), dtype=np.int64, count=len(peak_data))
+            excess = np.fromiter(peak_data.values(), dtype=np.float64, count=len(peak_data)) - resource.capacity
+            over = excess > 0
+            if over.any():
+                hours, excess = hours[over], excess[over]
+                run_starts = np.flatnonzero(np.diff(hours, prepend=hours[0] - 2) != 1)
+                run_ends = np.append(run_starts[1:], hours.size) - 1
+                run_excess = np.maximum.reduceat(excess, run_starts)
                 resource_conflicts.append({
                     'resource_id': res_id,
-                    'over_allocation_periods': [{
-                        'start': start_date.isoformat(),
-                        'end': (start_date + timedelta(hours=24)).isoformat(),
-                        'excess': max_usage - resource.capacity
-                    }]
-                })
-    
-    # Create allocation results
-    allocations = []
-    for task in input_data.tasks:
-        for req in task.required_resources:
-            resource = next((r for r in input_data.resources if r.id == req['resource_id']), None)
-            if resource:
-                allocations.append({
-                    'task_id': task.id,
-                    'resource_id': req['resource_id'],
-                    'start_date': start_date.isoformat(),
-                    'end_date': (start_date + timedelta(hours=task.duration)).isoformat(),
-                    'hours_allocated': task.duration * req['quantity'],
-                    'cost': task.duration * resource.cost_per_hour * req['quantity']
+                    'over_allocation_periods': [
+                        {
+                            'start': _hours_isoformat(start_date, first),
+                            'end': _hours_isoformat(start_date, last + 1),
+                            'excess': peak_excess
+                        }
+                        for first, last, peak_excess in zip(
+                            hours[run_starts].tolist(), hours[run_ends].tolist(), run_excess.tolist()
+                        )
+                    ]
                 })
     
     return {
@@ -436,8 +470,40 @@ def optimize_resource_allocation(input_data: OptimizationInput) -> Dict:
         'recommendations': recommendations
     }
 
+def _input_digest(input_data: BaseModel) -> str:
+    """Digest of a request body, to recognise a repeat of the last run"""
+    return blake2b(input_data.model_dump_json().encode(), digest_size=16).hexdigest()
+
+def _stored_results(project: models.Project, key: str, digest: str) -> Optional[Dict]:
+    """Results saved under ``key`` if they were computed from the input with ``digest``"""
+    stored = project.resource_allocation or {}
+    if key in stored and (project.resource_allocation_digests or {}).get(key) == digest:
+        return stored[key]
+    return None
+
+def _store_results(project: models.Project, key: str, results: Dict, digest: str) -> bool:
+    """Save ``results`` under ``key`` in the project's resource_allocation JSON.
+
+    The input digest goes to its own column, outside the document clients
+    see. Returns False, leaving the project untouched, when the same results
+    are already stored.
+    """
+    stored = project.resource_allocation or {}
+    # Stored results come back from the JSON column, so compare encodings
+    if key in stored and json.dumps(stored[key]) == json.dumps(results):
+        return False
+    if not project.resource_allocation:
+        project.resource_allocation = {}
+    project.resource_allocation[key] = results
+    # Digests written into the document before they had their own column
+    project.resource_allocation.pop('input_digests', None)
+    project.resource_allocation_digests = {**(project.resource_allocation_digests or {}), key: digest}
+    # The JSON column was mutated in place, which SQLAlchemy cannot detect
+    flag_modified(project, "resource_allocation")
+    return True
+
 @router.post("/{project_id}/resources/optimize")
-async def optimize_resources(
+def optimize_resources(
     project_id: int,
     input_data: OptimizationInput,
     db: Session = Depends(get_db),
@@ -452,26 +518,33 @@ async def optimize_resources(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Run both resource leveling and optimization
-    leveling_results = resource_leveling_algorithm(input_data.tasks, input_data.resources, 
-                                                 datetime.fromisoformat(input_data.project_start_date))
-    optimization_results = optimize_resource_allocation(input_data)
-    
-    results = {
-        "resource_leveling": leveling_results,
-        "optimization": optimization_results
-    }
+    # A repeat of the last request gets the stored results back
+    digest = _input_digest(input_data)
+    cached = _stored_results(project, 'latest', digest)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Run both resource leveling and optimization, sharing the one leveling pass
+        leveling_results = resource_leveling_algorithm(input_data.tasks, input_data.resources, 
+                                                     datetime.fromisoformat(input_data.project_start_date))
+        optimization_results = optimize_resource_allocation(input_data, leveling_results)
+    
+        results = {
+            "resource_leveling": leveling_results,
+            "optimization": optimization_results
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Store results in project
-    if not project.resource_allocation:
-        project.resource_allocation = {}
-    project.resource_allocation['latest'] = results
-    db.commit()
+    # Store results in project, skipping the write when nothing changed
+    if _store_results(project, 'latest', results, digest):
+        db.commit()
     
     return results
 
 @router.post("/{project_id}/resources/scenarios")
-async def analyze_scenarios(
+def analyze_scenarios(
     project_id: int,
     input_data: ScenarioAnalysisInput,
     db: Session = Depends(get_db),
@@ -486,42 +559,53 @@ async def analyze_scenarios(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Run base scenario
-    base_results = optimize_resource_allocation(input_data.base_scenario)
-    
-    # Run variations
-    scenario_results = {
-        "base": base_results
-    }
+    # A repeat of the last request gets the stored results back
+    digest = _input_digest(input_data)
+    cached = _stored_results(project, 'scenarios', digest)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Run base scenario; its leveling is shared by every variation that
+        # leaves task durations alone, since costs do not affect the schedule
+        base_input = input_data.base_scenario
+        base_leveling = resource_leveling_algorithm(
+            base_input.tasks, base_input.resources, datetime.fromisoformat(base_input.project_start_date)
+        )
+        base_results = optimize_resource_allocation(base_input, base_leveling)
+    
+        # Run variations
+        scenario_results = {
+            "base": base_results
+        }
     
-    for scenario_name, variations in input_data.variations.items():
-        # Create modified input data
-        modified_input = input_data.base_scenario.copy()
-        
-        # Apply variations
-        for param, factor in variations.items():
-            if param == "duration":
-                for task in modified_input.tasks:
-                    task.duration_hours *= factor
-            elif param == "cost":
-                for resource in modified_input.resources:
-                    resource.cost_per_hour *= factor
+        for scenario_name, variations in input_data.variations.items():
+            # Costs are scaled on the fly; only a duration change needs new
+            # task models, since it feeds the leveling
+            modified_input = base_input
+            if "duration" in variations:
+                factor = variations["duration"]
+                tasks = [task.model_copy(update={"duration": task.duration * factor}) for task in base_input.tasks]
+                modified_input = base_input.model_copy(update={"tasks": tasks})
         
-        # Run optimization for this scenario
-        scenario_results[scenario_name] = optimize_resource_allocation(modified_input)
-    
-    # Store results in project
-    if not project.resource_allocation:
-        project.resource_allocation = {}
-    project.resource_allocation['scenarios'] = scenario_results
-    db.commit()
+            # Run optimization for this scenario
+            leveled_result = None if "duration" in variations else base_leveling
+            scenario_results[scenario_name] = optimize_resource_allocation(
+                modified_input, leveled_result, variations.get("cost", 1.0)
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Store results in project, skipping the write when nothing changed
+    if _store_results(project, 'scenarios', scenario_results, digest):
+        db.commit()
     
     return scenario_results
 
 # Add missing endpoints for resource leveling and smoothing
 
 @router.post("/{project_id}/leveling")
-async def resource_leveling(
+def resource_leveling(
     project_id: int,
     input_data: ResourceLevelingInput,
     db: Session = Depends(get_db),
@@ -536,23 +620,30 @@ async def resource_leveling(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Run resource leveling
-    leveling_results = resource_leveling_algorithm(
-        input_data.tasks, 
-        input_data.resources, 
-        datetime.fromisoformat(input_data.project_start_date)
-    )
-    
-    # Store results in project
-    if not project.resource_allocation:
-        project.resource_allocation = {}
-    project.resource_allocation['leveling'] = leveling_results
-    db.commit()
+    # A repeat of the last request gets the stored results back
+    digest = _input_digest(input_data)
+    cached = _stored_results(project, 'leveling', digest)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Run resource leveling
+        leveling_results = resource_leveling_algorithm(
+            input_data.tasks, 
+            input_data.resources, 
+            datetime.fromisoformat(input_data.project_start_date)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Store results in project, skipping the write when nothing changed
+    if _store_results(project, 'leveling', leveling_results, digest):
+        db.commit()
     
     return leveling_results
 
 @router.post("/{project_id}/smoothing")
-async def resource_smoothing(
+def resource_smoothing(
     project_id: int,
     input_data: ResourceSmoothingInput,
     db: Session = Depends(get_db),
@@ -567,23 +658,30 @@ async def resource_smoothing(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Run resource smoothing
-    smoothing_results = resource_smoothing_algorithm(
-        input_data.tasks, 
-        input_data.resources, 
-        datetime.fromisoformat(input_data.project_start_date)
-    )
-    
-    # Store results in project
-    if not project.resource_allocation:
-        project.resource_allocation = {}
-    project.resource_allocation['smoothing'] = smoothing_results
-    db.commit()
+    # A repeat of the last request gets the stored results back
+    digest = _input_digest(input_data)
+    cached = _stored_results(project, 'smoothing', digest)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Run resource smoothing
+        smoothing_results = resource_smoothing_algorithm(
+            input_data.tasks, 
+            input_data.resources, 
+            datetime.fromisoformat(input_data.project_start_date)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Store results in project, skipping the write when nothing changed
+    if _store_results(project, 'smoothing', smoothing_results, digest):
+        db.commit()
     
     return smoothing_results
 
 @router.post("/{project_id}/optimize")
-async def optimize_resource_allocation_simple(
+def optimize_resource_allocation_simple(
     project_id: int,
     input_data: OptimizationInput,
     db: Session = Depends(get_db),
@@ -598,13 +696,20 @@ async def optimize_resource_allocation_simple(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Run optimization
-    optimization_results = optimize_resource_allocation(input_data)
-    
-    # Store results in project
-    if not project.resource_allocation:
-        project.resource_allocation = {}
-    project.resource_allocation['optimization'] = optimization_results
-    db.commit()
+    # A repeat of the last request gets the stored results back
+    digest = _input_digest(input_data)
+    cached = _stored_results(project, 'optimization', digest)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Run optimization
+        optimization_results = optimize_resource_allocation(input_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Store results in project, skipping the write when nothing changed
+    if _store_results(project, 'optimization', optimization_results, digest):
+        db.commit()
     
     return optimization_results
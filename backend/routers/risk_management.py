@@ -1,74 +1,151 @@
-from typing import Any, List, Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated, Any, List, Dict, Literal, Optional
+from functools import lru_cache
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy import case, func, literal, update
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 import numpy as np
-from scipy import stats
-import random
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the cache falls back to stdlib json
+    orjson = None
 
 from database import models
 from db import get_db
 from security import get_current_user
+from routers._risk_kernels import normals_to_ranges_nb
+from routers._responses import compact_floats, fast_json
 
 router = APIRouter()
 
+# Bound on variables per analysis keeps the worst-case work per request fixed
+MAX_VARIABLES = 50
+
 class SensitivityAnalysisInput(BaseModel):
     base_value: float = Field(..., gt=0)
     variables: Dict[str, Dict[str, float]] = Field(
         ...,
+        max_length=MAX_VARIABLES,
         description="Dict of variables with their min and max values"
     )
     iterations: int = Field(default=1000, ge=100, le=10000)
 
 class DecisionTreeNode(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     name: str
-    probability: float = Field(..., ge=0, le=1)
-    value: float
+    type: Literal['decision', 'chance', 'outcome']
+    probability: Optional[float] = Field(default=None, ge=0, le=1)
+    cost: Optional[float] = None
+    value: Optional[float] = None
     children: Optional[List['DecisionTreeNode']] = None
 
+# Resolve the self-reference once at import rather than on first use
+DecisionTreeNode.model_rebuild()
+
 class MonteCarloInput(BaseModel):
-    variables: Dict[str, Dict[str, float]]
+    variables: Dict[str, Dict[str, float]] = Field(..., max_length=MAX_VARIABLES)
     iterations: int = Field(default=1000, ge=100, le=10000)
-    correlation_matrix: Optional[Dict[str, Dict[str, float]]] = None
+    correlation_matrix: Optional[Dict[str, Annotated[Dict[str, float], Field(max_length=MAX_VARIABLES)]]] = Field(
+        None, max_length=MAX_VARIABLES
+    )
+    # Dense alternative to correlation_matrix: rows and columns follow
+    # correlation_order, or the order of variables when it is omitted
+    correlation_values: Optional[List[Annotated[List[float], Field(max_length=MAX_VARIABLES)]]] = Field(
+        None, max_length=MAX_VARIABLES
+    )
+    correlation_order: Optional[List[str]] = Field(None, max_length=MAX_VARIABLES)
+
+async def monte_carlo_body(request: Request) -> MonteCarloInput:
+    """Parse and validate the raw body in one pass through pydantic-core.
+
+    FastAPI would first decode the JSON into Python objects and then
+    validate those, which dominates for large correlation matrices.
+    """
+    body = await request.body()
+    try:
+        return MonteCarloInput.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)],
+            body=body
+        )
 
 class RiskAnalysisResult(BaseModel):
     method: str
     results: Dict[str, Any]
     visualization_data: Dict[str, Any]
 
+def _round2(values: np.ndarray) -> np.ndarray:
+    """Round to 2 decimals exactly like Python's ``round``.
+
+    ``np.round`` scales by 100 first, which can tip values sitting on a
+    halfway point the wrong way; those few are redone with ``round``.
+    """
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    halfway = np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-9 * np.maximum(np.abs(scaled), 1)
+    if halfway.any():
+        rounded[halfway] = [round(v, 2) for v in values[halfway].tolist()]
+    return rounded
+
 def perform_sensitivity_analysis(base_value: float, variables: Dict[str, Dict[str, float]], iterations: int) -> Dict:
     """Perform sensitivity analysis using tornado diagram approach"""
-    results = {}
-    for var_name, var_range in variables.items():
-        # Test variable at min while others at base
-        min_value = var_range['min']
-        max_value = var_range['max']
-        
-        # Calculate impact
-        min_impact = (min_value - base_value) / base_value * 100
-        max_impact = (max_value - base_value) / base_value * 100
-        
-        results[var_name] = {
-            'min_impact': round(min_impact, 2),
-            'max_impact': round(max_impact, 2),
-            'range': round(max_impact - min_impact, 2)
-        }
+    var_names = list(variables.keys())
+    mins = np.fromiter((v['min'] for v in variables.values()), dtype=np.float64, count=len(var_names))
+    maxs = np.fromiter((v['max'] for v in variables.values()), dtype=np.float64, count=len(var_names))
     
-    # Sort by range of impact
-    sorted_results = dict(
-        sorted(results.items(), key=lambda x: abs(x[1]['range']), reverse=True)
-    )
+    # Impact of each variable at its min and max while others stay at base
+    min_impacts = (mins - base_value) / base_value * 100
+    max_impacts = (maxs - base_value) / base_value * 100
+    ranges = _round2(max_impacts - min_impacts)
+    
+    # Sort by range of impact, largest first; ties keep input order
+    order = np.argsort(-np.abs(ranges), kind='stable')
+    min_impacts = _round2(min_impacts[order]).tolist()
+    max_impacts = _round2(max_impacts[order]).tolist()
+    ranges = ranges[order].tolist()
+    sorted_names = [var_names[i] for i in order]
+    
+    sorted_results = {
+        var_name: {
+            'min_impact': min_impact,
+            'max_impact': max_impact,
+            'range': impact_range
+        }
+        for var_name, min_impact, max_impact, impact_range in zip(sorted_names, min_impacts, max_impacts, ranges)
+    }
     
     return {
         'base_value': base_value,
         'variables': sorted_results,
         'visualization': {
-            'variables': list(sorted_results.keys()),
-            'min_impacts': [v['min_impact'] for v in sorted_results.values()],
-            'max_impacts': [v['max_impact'] for v in sorted_results.values()]
+            'variables': sorted_names,
+            'min_impacts': min_impacts,
+            'max_impacts': max_impacts
         }
     }
 
+@lru_cache(maxsize=256)
+def _sensitivity_json(base_value: float, bounds: tuple):
+    variables = {var_name: {'min': lo, 'max': hi} for var_name, lo, hi in bounds}
+    results = perform_sensitivity_analysis(base_value, variables, 0)
+    return orjson.dumps(results) if orjson is not None else json.dumps(results)
+
+def cached_sensitivity_analysis(base_value: float, variables: Dict[str, Dict[str, float]]) -> Dict:
+    """Sensitivity analysis, reusing earlier runs of identical inputs.
+
+    Repeated submissions from the UI skip the computation. The key keeps
+    the variables' order, which breaks ties in the ranking, and the cache
+    holds JSON, so every caller gets its own copy.
+    """
+    bounds = tuple((var_name, v['min'], v['max']) for var_name, v in variables.items())
+    cached = _sensitivity_json(base_value, bounds)
+    return orjson.loads(cached) if orjson is not None else json.loads(cached)
+
 def evaluate_decision_tree(node: DecisionTreeNode) -> Dict:
     """Recursively evaluate a decision tree node with comprehensive analysis"""
     if node.type == 'outcome':
@@ -85,14 +162,23 @@ def evaluate_decision_tree(node: DecisionTreeNode) -> Dict:
         }
     
     elif node.type == 'chance':
-        # For chance nodes, calculate expected value of all outcomes
+        # For chance nodes, calculate expected value of all outcomes,
+        # tracking the best and worst net values along the way
         total_expected_value = 0
+        best_case = worst_case = 0
         outcomes = []
         
         if node.children:
             for child in node.children:
                 child_result = evaluate_decision_tree(child)
                 total_expected_value += child_result['expected_value']
+                net_value = child_result['net_value']
+                if not outcomes:
+                    best_case = worst_case = net_value
+                elif net_value > best_case:
+                    best_case = net_value
+                elif net_value < worst_case:
+                    worst_case = net_value
                 outcomes.append(child_result)
         
         return {
@@ -100,9 +186,9 @@ def evaluate_decision_tree(node: DecisionTreeNode) -> Dict:
             'type': node.type,
             'expected_value': total_expected_value,
             'outcomes': outcomes,
-            'best_case': max([o['net_value'] for o in outcomes]) if outcomes else 0,
-            'worst_case': min([o['net_value'] for o in outcomes]) if outcomes else 0,
-            'risk_range': max([o['net_value'] for o in outcomes]) - min([o['net_value'] for o in outcomes]) if outcomes else 0
+            'best_case': best_case,
+            'worst_case': worst_case,
+            'risk_range': best_case - worst_case
         }
     
     elif node.type == 'decision':
@@ -142,76 +228,120 @@ def evaluate_decision_tree(node: DecisionTreeNode) -> Dict:
 def monte_carlo_simulation(
     variables: Dict[str, Dict[str, float]],
     iterations: int,
-    correlation_matrix: Optional[Dict[str, Dict[str, float]]] = None
+    correlation_matrix: Optional[Dict[str, Dict[str, float]]] = None,
+    correlation_values: Optional[List[List[float]]] = None,
+    correlation_order: Optional[List[str]] = None
 ) -> Dict:
-    """Perform Monte Carlo simulation"""
-    results = []
+    """Perform Monte Carlo simulation.
+
+    Correlations come either as ``correlation_matrix``, a dict of dicts, or
+    as the dense ``correlation_values`` in ``correlation_order``.
+    """
     var_names = list(variables.keys())
     
     # Create correlation matrix if provided
-    if correlation_matrix:
+    if correlation_values:
+        if len(correlation_values) != len(var_names) or any(len(row) != len(var_names) for row in correlation_values):
+            raise ValueError("correlation_values must be a square matrix with one row per variable")
+        corr_matrix = np.asarray(correlation_values, dtype=np.float64)
+        if correlation_order and correlation_order != var_names:
+            position = {var_name: i for i, var_name in enumerate(correlation_order)}
+            if len(position) != len(var_names) or not all(var_name in position for var_name in var_names):
+                raise ValueError("correlation_order must list each variable exactly once")
+            index = [position[var_name] for var_name in var_names]
+            corr_matrix = corr_matrix[np.ix_(index, index)]
+    elif correlation_matrix:
         corr_matrix = np.array([[correlation_matrix[v1].get(v2, 0) 
                                 for v2 in var_names] 
                                 for v1 in var_names])
     else:
-        corr_matrix = np.eye(len(var_names))
+        corr_matrix = None
     
-    # Generate correlated random variables
-    for _ in range(iterations):
-        # Generate correlated standard normal variables
-        normal_vars = np.random.multivariate_normal(
-            mean=[0] * len(var_names),
-            cov=corr_matrix
-        )
-        
-        # Transform to uniform distribution
-        uniform_vars = stats.norm.cdf(normal_vars)
-        
-        # Transform to target distributions
-        iteration_result = {}
-        for i, var_name in enumerate(var_names):
-            var_range = variables[var_name]
-            min_val = var_range['min']
-            max_val = var_range['max']
+    # Standard normals, one row per variable
+    rng = np.random.default_rng()
+    normal_vars = rng.standard_normal((len(var_names), iterations))
+    
+    # Independent variables (no matrix) skip the linear algebra entirely
+    if corr_matrix is not None:
+        diagonal = np.diagonal(corr_matrix)
+        if np.count_nonzero(corr_matrix - np.diag(diagonal)) == 0:
+            # A diagonal matrix only scales each variable
+            if (diagonal < 0).any():
+                raise ValueError("Correlation matrix must be positive semi-definite")
+            normal_vars *= np.sqrt(diagonal)[:, None]
+        else:
+            # Factor the correlation matrix once; a tiny ridge lets perfectly
+            # correlated (singular but valid) matrices through
+            try:
+                factor = np.linalg.cholesky(corr_matrix)
+            except np.linalg.LinAlgError:
+                try:
+                    factor = np.linalg.cholesky(corr_matrix + 1e-10 * np.eye(len(var_names)))
+                except np.linalg.LinAlgError:
+                    raise ValueError("Correlation matrix must be positive semi-definite")
             
-            # Linear transformation from [0,1] to [min,max]
-            value = min_val + uniform_vars[i] * (max_val - min_val)
-            iteration_result[var_name] = value
-        
-        results.append(iteration_result)
+            normal_vars = factor @ normal_vars
+    
+    # Transform to uniform distribution and on to each variable's [min,max]
+    mins = np.array([variables[var_name]['min'] for var_name in var_names])
+    ranges = np.array([variables[var_name]['max'] - variables[var_name]['min'] for var_name in var_names])
+    # Mean and std come out of the same pass. One row per iteration; the
+    # transpose keeps each variable's draws contiguous (column-major)
+    means = np.empty(len(var_names))
+    stds = np.empty(len(var_names))
+    samples = normals_to_ranges_nb(normal_vars, mins, ranges, means, stds).T
     
-    # Calculate statistics
-    stats_results = {}
-    for var_name in var_names:
-        values = [r[var_name] for r in results]
-        stats_results[var_name] = {
-            'mean': np.mean(values),
-            'std': np.std(values),
+    # Percentiles per variable (column) still need the full draws
+    p10, p50, p90 = np.percentile(samples, [10, 50, 90], axis=0)
+    stats_results = {
+        var_name: {
+            'mean': means[i],
+            'std': stds[i],
             'percentiles': {
-                '10': np.percentile(values, 10),
-                '50': np.percentile(values, 50),
-                '90': np.percentile(values, 90)
+                '10': p10[i],
+                '50': p50[i],
+                '90': p90[i]
             }
         }
+        for i, var_name in enumerate(var_names)
+    }
     
     return {
         'iterations': iterations,
         'statistics': stats_results,
         'visualization': {
             'variables': var_names,
-            'data': results
+            # One list of draws per variable, in the order of 'variables'
+            'columns': compact_floats(samples.T)
         }
     }
 
+def _store_analysis(db: Session, project_id: int, key: str, results: Dict) -> None:
+    """Write ``results`` under ``key`` of the project's risk_analysis in one UPDATE.
+
+    SQLite's ``json_set`` merges the key into the stored document, so the
+    other analyses are neither loaded nor re-encoded in Python.
+    """
+    stored = models.Project.risk_analysis
+    document = case((func.json_type(stored) == 'object', stored), else_=func.json('{}'))
+    db.execute(
+        update(models.Project)
+        .where(models.Project.id == project_id)
+        .values(risk_analysis=func.json_set(document, f'$.{key}', func.json(literal(results, stored.type))))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
 @router.post("/{project_id}/risk/sensitivity")
-async def run_sensitivity_analysis(
+def run_sensitivity_analysis(
     project_id: int,
     input_data: SensitivityAnalysisInput,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Run sensitivity analysis for project variables"""
-    project = db.query(models.Project).filter(
+    # Only the id is needed; the stored analyses are never loaded
+    project = db.query(models.Project.id).filter(
         models.Project.id == project_id,
         models.Project.user_id == current_user.id
     ).first()
@@ -219,29 +349,22 @@ async def run_sensitivity_analysis(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    results = perform_sensitivity_analysis(
-        input_data.base_value,
-        input_data.variables,
-        input_data.iterations
-    )
+    results = cached_sensitivity_analysis(input_data.base_value, input_data.variables)
     
-    # Store results in project
-    if not project.risk_analysis:
-        project.risk_analysis = {}
-    project.risk_analysis['sensitivity'] = results
-    db.commit()
+    _store_analysis(db, project_id, 'sensitivity', results)
     
     return results
 
 @router.post("/{project_id}/risk/decision-tree")
-async def analyze_decision_tree(
+def analyze_decision_tree(
     project_id: int,
     tree: DecisionTreeNode,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """Analyze decision tree for risk assessment"""
-    project = db.query(models.Project).filter(
+    # Only the id is needed; the stored analyses are never loaded
+    project = db.query(models.Project.id).filter(
         models.Project.id == project_id,
         models.Project.user_id == current_user.id
     ).first()
@@ -251,23 +374,27 @@ async def analyze_decision_tree(
     
     results = evaluate_decision_tree(tree)
     
-    # Store results in project
-    if not project.risk_analysis:
-        project.risk_analysis = {}
-    project.risk_analysis['decision_tree'] = results
-    db.commit()
+    _store_analysis(db, project_id, 'decision_tree', results)
     
     return results
 
-@router.post("/{project_id}/risk/monte-carlo")
-async def run_monte_carlo_simulation(
+@router.post(
+    "/{project_id}/risk/monte-carlo",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": MonteCarloInput.model_json_schema()}}
+    }}
+)
+def run_monte_carlo_simulation(
     project_id: int,
-    input_data: MonteCarloInput,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user),
+    # Resolved after authentication, like a regular body parameter
+    input_data: MonteCarloInput = Depends(monte_carlo_body)
 ):
     """Run Monte Carlo simulation for uncertainty modeling"""
-    project = db.query(models.Project).filter(
+    # Only the id is needed; the stored analyses are never loaded
+    project = db.query(models.Project.id).filter(
         models.Project.id == project_id,
         models.Project.user_id == current_user.id
     ).first()
@@ -275,16 +402,17 @@ async def run_monte_carlo_simulation(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    results = monte_carlo_simulation(
-        input_data.variables,
-        input_data.iterations,
-        input_data.correlation_matrix
-    )
+    try:
+        results = monte_carlo_simulation(
+            input_data.variables,
+            input_data.iterations,
+            input_data.correlation_matrix,
+            input_data.correlation_values,
+            input_data.correlation_order
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Store results in project
-    if not project.risk_analysis:
-        project.risk_analysis = {}
-    project.risk_analysis['monte_carlo'] = results
-    db.commit()
+    _store_analysis(db, project_id, 'monte_carlo', results)
     
-    return results
+    return fast_json(results)
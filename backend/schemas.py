@@ -1,7 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Annotated, Optional, Dict, Any, List
 from datetime import datetime
 
+# Largest expert panel accepted anywhere; the cost estimation endpoints use
+# the same bound
+MAX_EXPERT_ESTIMATES = 1000
+
 class UserBase(BaseModel):
     username: str
     email: str
@@ -39,8 +43,8 @@ class EstimationInput(BaseModel):
     ufp: Optional[int] = None
     caf: Optional[float] = None
     
-    # Expert Judgment inputs
-    expert_estimates: Optional[List[float]] = None
+    # Expert Judgment inputs, bounded like the cost estimation endpoints
+    expert_estimates: Optional[List[Annotated[float, Field(allow_inf_nan=False)]]] = Field(None, max_length=MAX_EXPERT_ESTIMATES)
     
     # Regression inputs
     regression_size: Optional[float] = None